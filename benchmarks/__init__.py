@@ -0,0 +1,6 @@
+"""Reproducible performance benchmarks for vidstab
+
+Synthetic shaky videos with known ground truth transforms are generated with
+:mod:`benchmarks.synthetic`; :mod:`benchmarks.run` times the ``VidStab`` methods on them and
+:mod:`benchmarks.compare` compares saved results between commits.
+"""
@@ -0,0 +1,86 @@
+"""Compare two saved benchmark result files
+
+Arguments:
+  baseline
+        JSON results from ``benchmarks.run`` to compare against.
+  candidate
+        JSON results from ``benchmarks.run`` to compare.
+  -t --threshold
+        Relative fps drop reported as a regression.
+
+Usage:
+    python -m benchmarks.compare baseline.json candidate.json -t 0.1
+"""
+import argparse
+import json
+
+
+def _case_key(case):
+    # keyed on the path actually run; use_opencl=True falls back to numpy without an OpenCL runtime
+    opencl = case.get('opencl_used', case.get('opencl', False))
+    return case['stage'], case['kp_method'], opencl, tuple(case['resolution']), case['n_frames']
+
+
+def load_results(path):
+    """Load JSON results saved by ``benchmarks.run``"""
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(baseline, candidate, threshold=0.1):
+    """Match cases between two result sets and compute fps/memory ratios
+
+    :param baseline: results dict from ``benchmarks.run.run_benchmarks``
+    :param candidate: results dict from ``benchmarks.run.run_benchmarks``
+    :param threshold: relative fps drop flagged as a regression
+    :return: list of dicts describing each case found in both result sets
+    """
+    baseline_cases = {_case_key(c): c for c in baseline['results'] if 'error' not in c}
+
+    comparisons = []
+    for case in candidate['results']:
+        base_case = baseline_cases.get(_case_key(case))
+        if base_case is None or 'error' in case:
+            continue
+
+        fps_ratio = case['fps'] / base_case['fps']
+        memory_ratio = None
+        if case['peak_memory_mb'] and base_case['peak_memory_mb']:
+            memory_ratio = case['peak_memory_mb'] / base_case['peak_memory_mb']
+
+        comparisons.append({'case': _case_key(case),
+                            'baseline_fps': base_case['fps'],
+                            'candidate_fps': case['fps'],
+                            'fps_ratio': fps_ratio,
+                            'memory_ratio': memory_ratio,
+                            'regression': fps_ratio < 1 - threshold})
+
+    return comparisons
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('baseline', help='JSON results to compare against.')
+    ap.add_argument('candidate', help='JSON results to compare.')
+    ap.add_argument('-t', '--threshold', type=float, default=0.1,
+                    help='Relative fps drop reported as a regression.')
+    args = vars(ap.parse_args())
+
+    baseline_results = load_results(args['baseline'])
+    candidate_results = load_results(args['candidate'])
+    print('baseline:  {}'.format(baseline_results['meta'].get('git_commit')))
+    print('candidate: {}'.format(candidate_results['meta'].get('git_commit')))
+
+    n_regressions = 0
+    for comparison in compare_results(baseline_results, candidate_results, threshold=args['threshold']):
+        stage, kp_method, opencl, (w, h), n_frames = comparison['case']
+        memory_ratio = comparison['memory_ratio']
+        flag = '  REGRESSION' if comparison['regression'] else ''
+        n_regressions += comparison['regression']
+        print('{:<16} {:<6} {} {}x{} {:>5}f  {:8.1f} -> {:8.1f} fps ({:5.2f}x)  mem {}{}'.format(
+            stage, kp_method, 'umat ' if opencl else 'numpy', w, h, n_frames,
+            comparison['baseline_fps'], comparison['candidate_fps'], comparison['fps_ratio'],
+            '{:5.2f}x'.format(memory_ratio) if memory_ratio is not None else '  n/a',
+            flag))
+
+    print('{} regression(s) found'.format(n_regressions))
@@ -0,0 +1,270 @@
+"""Benchmark VidStab on synthetic shaky videos
+
+Times ``gen_transforms``, ``stabilize`` and ``apply_transforms`` for each keypoint method,
+resolution and video length; reports fps, peak (python/numpy) memory and error of the estimated
+transforms against the ground truth.  Transforms for the ``apply_transforms`` stage are generated
+before timing starts, so that stage measures rendering of stored transforms only.  Results are saved
+as JSON for use with ``benchmarks.compare``.
+
+Arguments:
+  -o --output
+        Path to save JSON results to.
+  -k --kpMethods
+        Keypoint detectors to benchmark.
+  -r --resolutions
+        Frame sizes to benchmark as WIDTHxHEIGHT.
+  -n --nFrames
+        Video lengths to benchmark.
+  -s --smoothingWindow
+        Smoothing window passed to VidStab methods.
+  --opencl
+        Benchmark plain numpy processing (off), cv2.UMat processing (on) or both.  Without an OpenCL
+        runtime, VidStab falls back to numpy so cv2.UMat cases are skipped (unless --forceUmat is given).
+  --forceUmat
+        Run the cv2.UMat code path even without an OpenCL runtime (OpenCV then runs it on the CPU).
+  --repeat
+        Number of timed runs per case (fastest is reported).
+  --noMemory
+        Skip the (slower) peak memory measurement run.
+
+Usage:
+    python -m benchmarks.run -o results.json -k GFTT ORB -r 640x480 1280x720 -n 120
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import cv2
+import numpy as np
+
+from vidstab import VidStab, __version__
+from .synthetic import gen_shaky_video
+
+# excluding non-free "SIFT" & "SURF" methods do to exclusion from opencv-contrib-python
+KP_METHODS = ["GFTT", "BRISK", "DENSE", "FAST", "HARRIS", "MSER", "ORB", "STAR"]
+STAGES = ['gen_transforms', 'stabilize', 'apply_transforms']
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _prepare_stage(stage, kp_method, input_path, output_path, smoothing_window, use_opencl=False,
+                   force_umat=False):
+    """Set up a single benchmark stage; returns ``(stabilizer, run)`` where only calling ``run`` is measured"""
+    with warnings.catch_warnings():
+        # the fallback to numpy is reported per case with opencl_used
+        warnings.simplefilter('ignore')
+        stabilizer = VidStab(kp_method=kp_method, use_opencl=use_opencl)
+    if use_opencl and force_umat:
+        # frames are kept as cv2.UMat even if OpenCV has no OpenCL device to run them on
+        stabilizer.use_opencl = True
+
+    if stage == 'gen_transforms':
+        def run():
+            stabilizer.gen_transforms(input_path, smoothing_window=smoothing_window, show_progress=False)
+    elif stage == 'stabilize':
+        def run():
+            stabilizer.stabilize(input_path, output_path, smoothing_window=smoothing_window, show_progress=False)
+    elif stage == 'apply_transforms':
+        # only rendering of the stored transforms is measured
+        stabilizer.gen_transforms(input_path, smoothing_window=smoothing_window, show_progress=False)
+
+        def run():
+            stabilizer.apply_transforms(input_path, output_path, show_progress=False)
+    else:
+        raise ValueError('Invalid stage: {}'.format(stage))
+
+    return stabilizer, run
+
+
+def transform_error(stabilizer, true_transforms):
+    """Root mean squared error of estimated raw frame to frame transforms vs the ground truth
+
+    :param stabilizer: ``VidStab`` object that has processed the video
+    :param true_transforms: ground truth transforms returned by ``gen_shaky_video``
+    :return: dict of rmse for ``dx``, ``dy`` & ``da``
+    """
+    # the trajectory is the cumulative sum of the raw transforms
+    estimated = np.diff(stabilizer.trajectory, axis=0, prepend=np.zeros((1, 3)))
+    n = min(estimated.shape[0], true_transforms.shape[0])
+    rmse = np.sqrt(np.mean((estimated[:n] - true_transforms[:n]) ** 2, axis=0))
+
+    return {'dx': float(rmse[0]), 'dy': float(rmse[1]), 'da': float(rmse[2])}
+
+
+def benchmark_case(stage, kp_method, input_path, output_path, n_frames, true_transforms,
+                   smoothing_window=30, repeat=1, measure_memory=True, use_opencl=False, force_umat=False):
+    """Time one stage/keypoint method combination on one video
+
+    :return: dict of benchmark results for the case
+    """
+    timings = []
+    stabilizer = None
+    for _ in range(repeat):
+        stabilizer, run = _prepare_stage(stage, kp_method, input_path, output_path, smoothing_window, use_opencl,
+                                         force_umat)
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+
+    seconds = min(timings)
+    result = {'opencl_used': stabilizer.use_opencl,
+              'seconds': seconds,
+              'fps': n_frames / seconds,
+              'transform_rmse': transform_error(stabilizer, true_transforms),
+              'peak_memory_mb': None}
+
+    if measure_memory:
+        _, run = _prepare_stage(stage, kp_method, input_path, output_path, smoothing_window, use_opencl,
+                                force_umat)
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result['peak_memory_mb'] = peak / 1024.0 ** 2
+
+    return result
+
+
+def run_benchmarks(kp_methods=('GFTT',), resolutions=((640, 480),), lengths=(120,), stages=STAGES,
+                   smoothing_window=30, repeat=1, measure_memory=True, opencl_modes=(False,), force_umat=False,
+                   log=print):
+    """Run the benchmark suite
+
+    :param kp_methods: keypoint detectors to benchmark
+    :param resolutions: ``(width, height)`` frame sizes to benchmark
+    :param lengths: number of frames in benchmarked videos
+    :param stages: ``VidStab`` methods to benchmark
+    :param smoothing_window: smoothing window passed to ``VidStab`` methods
+    :param repeat: number of timed runs per case (fastest is reported)
+    :param measure_memory: should a ``tracemalloc`` run be done to measure peak memory?
+    :param opencl_modes: values of ``VidStab(use_opencl=...)`` to benchmark
+    :param force_umat: should the ``cv2.UMat`` path be run (on the CPU) when there's no OpenCL runtime?
+                       If ``False``, ``use_opencl=True`` cases are skipped with a warning in that case.
+    :param log: function used to print progress (``None`` for no output)
+    :return: dict with ``meta`` and ``results`` keys (see ``save_results``)
+    """
+    if True in opencl_modes and not cv2.ocl.haveOpenCL() and not force_umat:
+        # VidStab would fall back to numpy and the same path would be timed twice
+        warnings.warn('OpenCL is not available; skipping cv2.UMat cases (use force_umat to run them on the CPU)')
+        opencl_modes = [mode for mode in opencl_modes if not mode]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = os.path.join(tmp_dir, 'stable.avi')
+        for w, h in resolutions:
+            for n_frames in lengths:
+                input_path = os.path.join(tmp_dir, 'shaky_{}x{}_{}.avi'.format(w, h, n_frames))
+                true_transforms = gen_shaky_video(input_path, n_frames=n_frames, frame_size=(w, h))
+
+                for kp_method in kp_methods:
+                    for stage in stages:
+                        for use_opencl in opencl_modes:
+                            case = {'stage': stage, 'kp_method': kp_method, 'opencl': use_opencl,
+                                    'resolution': [w, h], 'n_frames': n_frames}
+                            try:
+                                case.update(benchmark_case(stage, kp_method, input_path, output_path,
+                                                           n_frames, true_transforms,
+                                                           smoothing_window=smoothing_window,
+                                                           repeat=repeat, measure_memory=measure_memory,
+                                                           use_opencl=use_opencl, force_umat=force_umat))
+                            except Exception as e:
+                                case['error'] = '{}: {}'.format(type(e).__name__, e)
+
+                            results.append(case)
+                            if log is not None:
+                                log(format_case(case))
+
+    meta = {'vidstab_version': __version__,
+            'opencv_version': cv2.__version__,
+            'opencl_available': cv2.ocl.haveOpenCL(),
+            'force_umat': force_umat,
+            'numpy_version': np.__version__,
+            'python_version': platform.python_version(),
+            'platform': platform.platform(),
+            'git_commit': _git_commit(),
+            'smoothing_window': smoothing_window,
+            'repeat': repeat,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+    return {'meta': meta, 'results': results}
+
+
+def format_case(case):
+    """One line summary of a benchmark case result"""
+    # label the path actually run; use_opencl=True falls back to numpy without an OpenCL runtime
+    umat = case.get('opencl_used', case['opencl'])
+    label = '{stage:<16} {kp_method:<6} {mode} {w}x{h} {n_frames:>5}f'.format(
+        mode='umat ' if umat else 'numpy', w=case['resolution'][0], h=case['resolution'][1], **case)
+    if 'error' in case:
+        return '{}  ERROR {}'.format(label, case['error'])
+
+    memory = case['peak_memory_mb']
+    memory = '{:8.1f}MB'.format(memory) if memory is not None else '       n/a'
+    return '{}  {:8.1f} fps {} rmse(dx, dy)=({:.3f}, {:.3f})'.format(label, case['fps'], memory,
+                                                                     case['transform_rmse']['dx'],
+                                                                     case['transform_rmse']['dy'])
+
+
+def save_results(results, output_path):
+    """Save benchmark results as JSON"""
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    def parse_resolution(v):
+        try:
+            w, h = v.lower().split('x')
+            return int(w), int(h)
+        except ValueError:
+            raise argparse.ArgumentTypeError('Resolution expected as WIDTHxHEIGHT.')
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-o', '--output', default='benchmark_results.json',
+                    help='Path to save JSON results to.')
+    ap.add_argument('-k', '--kpMethods', nargs='+', default=['GFTT', 'FAST', 'ORB'],
+                    help='Keypoint detectors to benchmark. Options: {}'.format(', '.join(KP_METHODS)))
+    ap.add_argument('-r', '--resolutions', nargs='+', type=parse_resolution, default=[(640, 480), (1280, 720)],
+                    help='Frame sizes to benchmark as WIDTHxHEIGHT.')
+    ap.add_argument('-n', '--nFrames', nargs='+', type=int, default=[120],
+                    help='Video lengths to benchmark.')
+    ap.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES,
+                    help='VidStab methods to benchmark.')
+    ap.add_argument('-s', '--smoothingWindow', type=int, default=30,
+                    help='Smoothing window passed to VidStab methods.')
+    ap.add_argument('--opencl', default='off', choices=['off', 'on', 'both'],
+                    help='Benchmark numpy processing (off), cv2.UMat processing (on) or both.')
+    ap.add_argument('--forceUmat', action='store_true',
+                    help='Run the cv2.UMat code path even without an OpenCL runtime (on the CPU).')
+    ap.add_argument('--repeat', type=int, default=1,
+                    help='Number of timed runs per case (fastest is reported).')
+    ap.add_argument('--noMemory', action='store_true',
+                    help='Skip the (slower) peak memory measurement run.')
+    args = vars(ap.parse_args())
+
+    bench_results = run_benchmarks(kp_methods=[kp.upper() for kp in args['kpMethods']],
+                                   resolutions=args['resolutions'],
+                                   lengths=args['nFrames'],
+                                   stages=args['stages'],
+                                   smoothing_window=args['smoothingWindow'],
+                                   repeat=args['repeat'],
+                                   measure_memory=not args['noMemory'],
+                                   opencl_modes={'off': [False], 'on': [True], 'both': [False, True]}[args['opencl']],
+                                   force_umat=args['forceUmat'])
+    save_results(bench_results, args['output'])
+    print('Results saved to {}'.format(args['output']))
@@ -0,0 +1,112 @@
+"""Generate synthetic shaky videos with known ground truth transforms"""
+import cv2
+import numpy as np
+
+
+def gen_texture(size, seed=0):
+    """Create a random textured BGR image with plenty of trackable corners
+
+    :param size: ``(width, height)`` of texture to create
+    :param seed: seed for ``np.random.RandomState``
+    :return: uint8 BGR image of shape ``(height, width, 3)``
+    """
+    w, h = size
+    rng = np.random.RandomState(seed)
+
+    noise = (rng.rand(h, w) * 255).astype('uint8')
+    texture = cv2.cvtColor(cv2.GaussianBlur(noise, (9, 9), 0), cv2.COLOR_GRAY2BGR)
+
+    n_shapes = max(w * h // 2000, 50)
+    for _ in range(n_shapes):
+        color = tuple(int(c) for c in rng.randint(0, 256, 3))
+        x, y = rng.randint(0, w), rng.randint(0, h)
+        r = int(rng.randint(3, max(4, min(w, h) // 30)))
+        if rng.rand() < 0.5:
+            cv2.rectangle(texture, (x, y), (x + 2 * r, y + r), color, -1)
+        else:
+            cv2.circle(texture, (x, y), r, color, -1)
+
+    return texture
+
+
+def gen_camera_path(n_frames, max_shift=8.0, max_angle=0.02, seed=0):
+    """Create a shaky camera path: a slow pan with random jitter on top
+
+    :param n_frames: number of frames in path
+    :param max_shift: maximum jitter in pixels
+    :param max_angle: maximum jitter in radians
+    :param seed: seed for ``np.random.RandomState``
+    :return: numpy array of shape ``(n_frames, 3)`` with a ``[x, y, angle]`` row per frame
+    """
+    rng = np.random.RandomState(seed)
+
+    pan = np.linspace(0, 1, n_frames).reshape(-1, 1) * rng.uniform(-4, 4, 3) * [max_shift, max_shift, max_angle]
+    jitter = rng.uniform(-1, 1, (n_frames, 3)) * [max_shift, max_shift, max_angle]
+
+    return pan + jitter
+
+
+def camera_matrix(x, y, angle, center):
+    """3x3 matrix mapping texture coords to frame coords for a camera at position ``(x, y, angle)``"""
+    cos_a, sin_a = np.cos(angle), np.sin(angle)
+    cx, cy = center
+    rotation = np.array([[cos_a, -sin_a, cx - cos_a * cx + sin_a * cy],
+                         [sin_a, cos_a, cy - sin_a * cx - cos_a * cy],
+                         [0, 0, 1]])
+    translation = np.array([[1, 0, x],
+                            [0, 1, y],
+                            [0, 0, 1]])
+
+    return rotation.dot(translation)
+
+
+def gen_shaky_video(output_path, n_frames=120, frame_size=(640, 480), max_shift=8.0, max_angle=0.02,
+                    seed=0, fps=30, output_fourcc='MJPG'):
+    """Write a synthetic shaky video and return the ground truth frame to frame transforms
+
+    Frames are cut out of a larger random texture by a camera following ``gen_camera_path``.
+    The ground truth transforms are in the same ``[dx, dy, da]`` format ``VidStab`` estimates
+    (i.e. mapping points in frame ``i`` to points in frame ``i + 1``).
+
+    :param output_path: path to write video to with ``cv2.VideoWriter``
+    :param n_frames: number of frames to write
+    :param frame_size: ``(width, height)`` of output frames
+    :param max_shift: maximum jitter in pixels
+    :param max_angle: maximum jitter in radians
+    :param seed: seed for texture & camera path generation
+    :param fps: frame rate of output video
+    :param output_fourcc: FourCC of codec used to write video
+    :return: numpy array of shape ``(n_frames - 1, 3)`` of ground truth ``[dx, dy, da]`` transforms
+
+    >>> from benchmarks.synthetic import gen_shaky_video
+    >>> true_transforms = gen_shaky_video('shaky.avi', n_frames=60, frame_size=(320, 240))
+    """
+    w, h = frame_size
+    # pad texture so the camera never leaves it
+    pad = int(4 * max_shift + max(w, h) * (4 * max_angle + 0.1))
+    texture = gen_texture((w + 2 * pad, h + 2 * pad), seed=seed)
+
+    path = gen_camera_path(n_frames, max_shift=max_shift, max_angle=max_angle, seed=seed)
+    center = (w / 2.0, h / 2.0)
+
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*output_fourcc), fps, (w, h), True)
+
+    true_transforms = np.zeros((n_frames - 1, 3))
+    prev_matrix = None
+    try:
+        for i, (x, y, angle) in enumerate(path):
+            matrix = camera_matrix(x - pad, y - pad, angle, center)
+            frame = cv2.warpAffine(texture, matrix[:2, :], (w, h), flags=cv2.INTER_LINEAR)
+            writer.write(frame)
+
+            if prev_matrix is not None:
+                # maps prev frame coords to current frame coords
+                frame_transform = matrix.dot(np.linalg.inv(prev_matrix))
+                true_transforms[i - 1, :] = [frame_transform[0, 2],
+                                             frame_transform[1, 2],
+                                             np.arctan2(frame_transform[1, 0], frame_transform[0, 0])]
+            prev_matrix = matrix
+    finally:
+        writer.release()
+
+    return true_transforms
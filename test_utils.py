@@ -1,3 +1,6 @@
+import io
+import json
+import tempfile
 import unittest
 import numpy as np
 import vidstab.utils as utils
@@ -11,11 +14,67 @@ class UtilTests(unittest.TestCase):
         self.assertTrue(np.allclose(utils.bfill_rolling_mean(test_arr, n=2),
                                     np.array([[2.5, 3.5, 4.5],
                                               [2.5, 3.5, 4.5]])))
+        self.assertTrue(np.allclose(utils.bfill_rolling_mean(np.hstack((test_arr, test_arr)), n=2),
+                                    np.array([[2.5, 3.5, 4.5, 2.5, 3.5, 4.5],
+                                              [2.5, 3.5, 4.5, 2.5, 3.5, 4.5]])))
 
         with self.assertRaises(ValueError) as err:
             utils.bfill_rolling_mean(test_arr, n=3)
         self.assertTrue(isinstance(err.exception, ValueError), 'reject when n > arr.shape[0]')
 
+    def test_bfill_variable_rolling_mean(self):
+        test_arr = np.arange(30, dtype=float).reshape(10, 3)
+
+        # constant window matches bfill_rolling_mean
+        self.assertTrue(np.allclose(utils.bfill_variable_rolling_mean(test_arr, [4] * 10),
+                                    utils.bfill_rolling_mean(test_arr, n=4)))
+
+        # segments are smoothed independently & windows are capped at segment length
+        smoothed = utils.bfill_variable_rolling_mean(test_arr, [4] * 10, segments=[(0, 3), (3, 10)])
+        self.assertTrue(np.allclose(smoothed[:3], utils.bfill_rolling_mean(test_arr[:3], n=3)))
+        self.assertTrue(np.allclose(smoothed[3:], utils.bfill_rolling_mean(test_arr[3:], n=4)))
+
+        windows = [1] * 5 + [3] * 5
+        smoothed = utils.bfill_variable_rolling_mean(test_arr, windows)
+        self.assertTrue(np.allclose(smoothed[:5], test_arr[:5]))
+        self.assertTrue(np.allclose(smoothed[9], test_arr[7:10].mean(axis=0)))
+
+    def test_growable_array(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for memmap_dir in [None, tmp_dir]:
+                arr = utils.GrowableArray(row_shape=(3,), capacity=2, memmap_dir=memmap_dir)
+                self.assertEqual(len(arr), 0)
+                self.assertEqual(arr.view().shape, (0, 3))
+
+                for i in range(100):
+                    arr.append([i, 2 * i, 3 * i])
+
+                expected = np.arange(100).reshape(-1, 1) * [1, 2, 3]
+                self.assertEqual(len(arr), 100)
+                self.assertTrue(np.allclose(arr.view(), expected))
+                self.assertTrue(np.allclose(arr[-1], [99, 198, 297]))
+                self.assertTrue(np.allclose(np.array(arr), expected))
+
+                arr.resize(150)
+                self.assertEqual(arr.view().shape, (150, 3))
+                self.assertTrue(np.allclose(arr[:100], expected))
+                arr.close()
+
+        structured = utils.GrowableArray(dtype=[('count', 'i4'), ('flag', '?')], capacity=1)
+        structured.append((1, True))
+        structured.append((2, False))
+        self.assertEqual(list(structured.view()['count']), [1, 2])
+
+    def test_transform_inlier_ratio(self):
+        transform = np.array([[1, 0, 1], [0, 1, 0]], dtype=float)
+        prev_pts = np.array([[[0, 0]], [[5, 5]], [[10, 0]], [[3, 3]]], dtype='float32')
+        cur_pts = np.array([[[1, 0]], [[6, 5]], [[11, 2]], [[20, 3]]], dtype='float32')
+
+        self.assertEqual(utils.transform_inlier_ratio(transform, prev_pts, cur_pts), 0.75)
+        self.assertEqual(utils.transform_inlier_ratio(transform, prev_pts, cur_pts, threshold=1), 0.5)
+        self.assertEqual(utils.transform_inlier_ratio(None, prev_pts, cur_pts), 0.0)
+        self.assertEqual(utils.transform_inlier_ratio(transform, prev_pts[:0], cur_pts[:0]), 0.0)
+
     def test_init_progress_bar(self):
         bar = utils.init_progress_bar(100, float('inf'), show_progress=True, message='Stabilizing')
         self.assertEqual(bar.suffix, '%(percent)d%%')
@@ -32,6 +91,24 @@ class UtilTests(unittest.TestCase):
         bar = utils.init_progress_bar(-1, float('inf'), show_progress=True, message='Stabilizing')
         self.assertEqual(bar, None)
 
+        bar = utils.init_progress_bar(-1, float('inf'), show_progress='json', message='Stabilizing')
+        self.assertIsInstance(bar, utils.JsonProgressBar)
+        self.assertIsNone(bar.max)
+
+    def test_json_progress_bar(self):
+        stream = io.StringIO()
+        bar = utils.JsonProgressBar('Test', max=4, min_interval=3600, stream=stream)
+        for _ in range(4):
+            bar.next()
+        bar.finish()
+
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        # first & last frame are always reported, others are throttled by min_interval
+        self.assertEqual([line['event'] for line in lines], ['progress', 'progress', 'finish'])
+        self.assertEqual([line['frames'] for line in lines], [1, 4, 4])
+        self.assertEqual(lines[-1]['percent'], 100.0)
+        self.assertEqual(lines[-1]['stage'], 'Test')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,19 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import socket
 import tempfile
+import time
 import unittest
 import pickle
 from urllib.request import urlopen, urlretrieve
 import numpy as np
+import cv2
 from vidstab import VidStab
+from vidstab.__main__ import main as vidstab_main
+from vidstab.preview import Preview
 
 # excluding non-free "SIFT" & "SURF" methods do to exclusion from opencv-contrib-python
 # see: https://github.com/skvark/opencv-python/issues/126
@@ -50,6 +60,9 @@ class TestVidStabClass(unittest.TestCase):
                          'trajectory/transform obj shapes')
         self.assertEqual(stabilizer.transforms.shape, stabilizer.trajectory.shape,
                          'trajectory/transform obj shapes')
+        self.assertEqual(stabilizer.metrics.shape[0], stabilizer.transforms.shape[0],
+                         'metrics/transform obj shapes')
+        self.assertTrue(np.all((stabilizer.metrics['inlier_ratio'] >= 0) & (stabilizer.metrics['inlier_ratio'] <= 1)))
 
         with tempfile.TemporaryDirectory() as tmpdir:
             output_vid = '{}/test_output.avi'.format(tmpdir)
@@ -63,6 +76,367 @@ class TestVidStabClass(unittest.TestCase):
             except Exception as e:
                 self.fail("stabilizer.stabilize ran into {}".format(e))
 
+            metrics_file = '{}/metrics.csv'.format(tmpdir)
+            stabilizer.save_metrics(metrics_file)
+            saved_metrics = np.genfromtxt(metrics_file, delimiter=',', names=True)
+            self.assertEqual(saved_metrics.dtype.names, stabilizer.metrics.dtype.names)
+            self.assertEqual(saved_metrics.shape, stabilizer.metrics.shape)
+
+    def test_reset_and_reuse(self):
+        input_vid = local_trunc_vid
+
+        stabilizer = VidStab()
+        stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False)
+        first_transforms = stabilizer.transforms.copy()
+        self.assertIsNone(stabilizer.vid_cap, 'capture released after gen_transforms')
+
+        # transforms from the previous run should not be appended to
+        stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False)
+        self.assertTrue(np.allclose(stabilizer.transforms, first_transforms))
+
+        stabilizer.reset()
+        self.assertIsNone(stabilizer.transforms)
+        self.assertEqual(len(stabilizer._raw_transforms), 0)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_vid = '{}/test_output.avi'.format(tmpdir)
+            with VidStab() as pooled_stabilizer:
+                for _ in range(2):
+                    pooled_stabilizer.stabilize(input_vid, output_vid, smoothing_window=2, show_progress=False)
+                    self.assertIsNone(pooled_stabilizer.writer, 'writer released after stabilize')
+                    self.assertIsNone(pooled_stabilizer.vid_cap, 'capture released after stabilize')
+
+    def test_apply_transforms_multi(self):
+        input_vid = local_trunc_vid
+
+        stabilizer = VidStab()
+        with self.assertRaises(AttributeError):
+            stabilizer.apply_transforms_multi(input_vid, [{'output_path': 'unused.avi'}])
+
+        stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            renditions = [{'output_path': '{}/full.avi'.format(tmpdir)},
+                          {'output_path': '{}/half.avi'.format(tmpdir), 'width': 160},
+                          {'output_path': '{}/square.avi'.format(tmpdir), 'width': 64, 'height': 64,
+                           'output_fourcc': 'MJPG'}]
+            stabilizer.apply_transforms_multi(input_vid, renditions, border_size=10, show_progress=False)
+
+            frame_counts = []
+            for rendition in renditions:
+                vid_cap = cv2.VideoCapture(rendition['output_path'])
+                grabbed_frame, frame = vid_cap.read()
+                self.assertTrue(grabbed_frame)
+                if 'width' in rendition:
+                    self.assertEqual(frame.shape[1], rendition['width'])
+                if 'height' in rendition:
+                    self.assertEqual(frame.shape[0], rendition['height'])
+                frame_counts.append(int(vid_cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+                vid_cap.release()
+
+            self.assertEqual(len(set(frame_counts)), 1, 'same number of frames in each rendition')
+
+    def test_gen_transforms_checkpoint_resume(self):
+        input_vid = local_trunc_vid
+
+        stabilizer = VidStab()
+        stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False)
+        expected_transforms = stabilizer.transforms.copy()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            checkpoint_path = '{}/transforms.ckpt'.format(tmpdir)
+
+            # interrupt processing after a checkpoint has been written
+            interrupted_stabilizer = VidStab()
+            gen_next_raw_transform = interrupted_stabilizer._gen_next_raw_transform
+
+            def interrupting_gen_next_raw_transform():
+                gen_next_raw_transform()
+                if len(interrupted_stabilizer._raw_transforms) == 7:
+                    raise KeyboardInterrupt
+
+            interrupted_stabilizer._gen_next_raw_transform = interrupting_gen_next_raw_transform
+            with self.assertRaises(KeyboardInterrupt):
+                interrupted_stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False,
+                                                      checkpoint_path=checkpoint_path, checkpoint_interval=5)
+            self.assertTrue(os.path.exists(checkpoint_path))
+
+            # checkpoints are only resumed by runs with the same input & options
+            with self.assertRaises(ValueError):
+                stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False,
+                                          checkpoint_path=checkpoint_path, rolling_shutter_bands=4)
+            with self.assertRaises(ValueError):
+                stabilizer.gen_transforms(local_vid, smoothing_window=2, show_progress=False,
+                                          checkpoint_path=checkpoint_path)
+            self.assertTrue(os.path.exists(checkpoint_path))
+
+            stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False,
+                                      checkpoint_path=checkpoint_path, checkpoint_interval=5)
+            self.assertTrue(np.allclose(stabilizer.transforms, expected_transforms))
+            self.assertFalse(os.path.exists(checkpoint_path), 'checkpoint removed after completion')
+
+    def test_opencl_fallback(self):
+        input_vid = local_trunc_vid
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            stabilizer = VidStab(use_opencl=True)
+        self.assertEqual(stabilizer.use_opencl, cv2.ocl.haveOpenCL())
+        self.assertEqual(stdout.getvalue(), '', 'fallback notice kept off stdout')
+
+        numpy_stabilizer = VidStab()
+        numpy_stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False)
+        stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False)
+        self.assertEqual(stabilizer.transforms.shape, numpy_stabilizer.transforms.shape)
+
+    def test_adaptive_smoothing(self):
+        input_vid = '{}/calm_then_shaky.avi'.format(tmp_dir.name)
+
+        # a still shot followed by a shaky one
+        vid_cap = cv2.VideoCapture(local_trunc_vid)
+        _, frame = vid_cap.read()
+        vid_cap.release()
+        h, w = frame.shape[:2]
+        shakes = np.random.RandomState(0).uniform(-8, 8, size=(30, 2))
+        writer = cv2.VideoWriter(input_vid, cv2.VideoWriter_fourcc(*'MJPG'), 30, (w, h), True)
+        for dx, dy in [(0, 0)] * 30 + list(shakes):
+            writer.write(cv2.warpAffine(frame, np.float64([[1, 0, dx], [0, 1, dy]]), (w, h),
+                                        borderMode=cv2.BORDER_REFLECT))
+        writer.release()
+
+        stabilizer = VidStab()
+        stabilizer.gen_transforms(input_vid, smoothing_window=20, show_progress=False)
+        self.assertIsNone(stabilizer.smoothing_windows)
+
+        stabilizer.gen_transforms(input_vid, smoothing_window=20, show_progress=False, adaptive_smoothing=True)
+        windows = stabilizer.smoothing_windows
+        self.assertEqual(windows.shape, (stabilizer.transforms.shape[0],))
+        self.assertTrue((windows >= 1).all() and (windows <= 20).all())
+        self.assertLess(windows[:15].max(), windows[-15:].min(), 'calm stretch gets smaller windows')
+        self.assertTrue(np.allclose(stabilizer.transforms,
+                                    stabilizer.smoothed_trajectory - stabilizer.trajectory +
+                                    stabilizer._raw_transforms.view()))
+
+        # stored (adaptive) transforms are rendered as is
+        transforms = stabilizer.transforms.copy()
+        output_vid = '{}/adaptive_output.avi'.format(tmp_dir.name)
+        multi_output_vid = '{}/adaptive_multi_output.avi'.format(tmp_dir.name)
+        stabilizer.apply_transforms(input_vid, output_vid, show_progress=False)
+        self.assertTrue(np.array_equal(stabilizer.transforms, transforms))
+        self.assertTrue(np.array_equal(stabilizer.smoothing_windows, windows))
+
+        stabilizer.apply_transforms_multi(input_vid, [{'output_path': multi_output_vid}], show_progress=False)
+        output_cap, multi_output_cap = cv2.VideoCapture(output_vid), cv2.VideoCapture(multi_output_vid)
+        n_frames = 0
+        while True:
+            grabbed_frame, output_frame = output_cap.read()
+            grabbed_multi_frame, multi_output_frame = multi_output_cap.read()
+            self.assertEqual(grabbed_frame, grabbed_multi_frame)
+            if not grabbed_frame:
+                break
+            self.assertLess(cv2.absdiff(output_frame, multi_output_frame).mean(), 0.5)
+            n_frames += 1
+        self.assertEqual(n_frames, transforms.shape[0] - 1)
+
+    def test_kp_autotune(self):
+        input_vid = local_trunc_vid
+
+        stabilizer = VidStab()
+        stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False)
+        self.assertIsNone(stabilizer.kp_autotuner)
+        self.assertTrue(np.isnan(stabilizer.metrics['detector_threshold']).all())
+        self.assertTrue((stabilizer.metrics['frame_ms'] > 0).all())
+
+        # untuned FAST finds thousands of keypoints on textured frames
+        stabilizer = VidStab(kp_method='FAST', target_kps=150)
+        threshold = stabilizer.kp_detector.getThreshold()
+        stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False)
+        metrics = stabilizer.metrics
+        self.assertGreater(stabilizer.kp_detector.getThreshold(), threshold, 'threshold warm-started')
+        self.assertTrue((metrics['kp_cap'] == 150).all())
+        self.assertTrue((metrics['detector_threshold'] == stabilizer.kp_detector.getThreshold()).any())
+        self.assertTrue((metrics['matched_kps'][1:] <= 150).all())
+
+        # an unreachable budget lowers the cap to its floor
+        stabilizer = VidStab(kp_method='ORB', frame_budget_ms=1e-3)
+        stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False)
+        self.assertEqual(stabilizer.metrics['kp_cap'][-1], 20)
+        self.assertLessEqual(stabilizer.metrics['detected_kps'][-1], 20)
+
+    def test_scene_cut_segments(self):
+        input_vid = local_trunc_vid
+
+        stabilizer = VidStab()
+        stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False, scene_cut_threshold=None)
+        self.assertEqual(len(stabilizer.segments), 1)
+        self.assertFalse(stabilizer.metrics['scene_cut'].any())
+
+        # every frame is treated as a cut with a negative threshold
+        stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False, scene_cut_threshold=-1)
+        self.assertEqual(len(stabilizer.segments), stabilizer.transforms.shape[0])
+        self.assertTrue(np.allclose(stabilizer.transforms, 0))
+
+    def test_roi_stabilize(self):
+        input_vid = local_trunc_vid
+        output_vid = '{}/roi_output.avi'.format(tmp_dir.name)
+        roi = (100, 50, 120, 80)
+
+        stabilizer = VidStab()
+        stabilizer.stabilize(input_vid, output_vid, smoothing_window=2, border_size=10, roi=roi)
+
+        self.assertEqual(stabilizer.roi_boxes.shape, (stabilizer.transforms.shape[0], 4))
+        self.assertTrue(np.allclose(stabilizer.roi_boxes[:, 2:], roi[2:]), 'box size is fixed')
+
+        vid_cap = cv2.VideoCapture(output_vid)
+        grabbed_frame, frame = vid_cap.read()
+        vid_cap.release()
+        self.assertTrue(grabbed_frame)
+        self.assertEqual(frame.shape[:2], (roi[3] + 20, roi[2] + 20))
+
+        stabilizer.reset()
+        self.assertIsNone(stabilizer.roi_boxes)
+
+        with self.assertRaises(ValueError):
+            stabilizer.gen_transforms(input_vid, show_progress=False, roi=(-50, -50, 30, 30))
+        self.assertIsNone(stabilizer.vid_cap)
+
+        # a subject without any texture has no keypoints to track
+        flat_vid = '{}/flat.avi'.format(tmp_dir.name)
+        writer = cv2.VideoWriter(flat_vid, cv2.VideoWriter_fourcc(*'MJPG'), 30, (160, 120), True)
+        for _ in range(5):
+            writer.write(np.full((120, 160, 3), 128, dtype='uint8'))
+        writer.release()
+
+        stabilizer.gen_transforms(flat_vid, smoothing_window=2, show_progress=False, roi=(10, 60, 40, 40))
+        self.assertTrue(stabilizer.metrics['fallback'].all())
+        self.assertTrue(np.allclose(stabilizer.transforms, 0))
+        self.assertTrue(np.allclose(stabilizer.roi_boxes, (10, 60, 40, 40)), 'box left where it is')
+
+    def test_rolling_shutter(self):
+        input_vid = local_trunc_vid
+        output_vid = '{}/rolling_shutter_output.avi'.format(tmp_dir.name)
+
+        stabilizer = VidStab()
+        stabilizer.stabilize(input_vid, output_vid, smoothing_window=2, border_size=10, rolling_shutter_bands=4)
+        self.assertEqual(stabilizer.band_motion.shape, (stabilizer.transforms.shape[0], 4, 2))
+
+        vid_cap = cv2.VideoCapture(input_vid)
+        input_shape = vid_cap.read()[1].shape
+        vid_cap.release()
+
+        vid_cap = cv2.VideoCapture(output_vid)
+        grabbed_frame, frame = vid_cap.read()
+        vid_cap.release()
+        self.assertTrue(grabbed_frame)
+        self.assertEqual(frame.shape, (input_shape[0] + 20, input_shape[1] + 20, 3))
+
+        stabilizer.gen_transforms(input_vid, smoothing_window=2, show_progress=False)
+        self.assertIsNone(stabilizer.band_motion)
+
+    def test_cli_json_progress(self):
+        input_vid = local_trunc_vid
+        output_vid = '{}/cli_output.avi'.format(tmp_dir.name)
+        metrics_path = '{}/cli_metrics.csv'.format(tmp_dir.name)
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            vidstab_main(['-i', input_vid, '-o', output_vid, '-s', '2', '-b', '10', '-k', 'ORB',
+                          '--keyPointKwargs', '{"nfeatures": 200}', '--metricsOutput', metrics_path,
+                          '--progress', 'json'])
+
+        lines = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(lines[-1]['event'], 'report')
+        self.assertIn('stabilize', lines[-1]['stages'])
+        self.assertGreater(lines[-1]['frames'], 0)
+        self.assertIn('progress', [line['event'] for line in lines[:-1]])
+        # frames written to the output are counted
+        finish = [line for line in lines if line['event'] == 'finish'][-1]
+        self.assertEqual(finish['frames'], finish['total'])
+        self.assertEqual(finish['frames'], int(cv2.VideoCapture(output_vid).get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.assertEqual(lines[-1]['frames'], finish['frames'], 'report counts frames written')
+        self.assertGreater(lines[-1]['frames_analysed'], lines[-1]['frames'])
+
+        # analysis runs a smoothing window past --maxFrames; only written frames are reported
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            vidstab_main(['-i', input_vid, '-o', output_vid, '-s', '5', '-m', '20', '--progress', 'json'])
+        report = json.loads(stdout.getvalue().splitlines()[-1])
+        self.assertEqual(report['frames'], int(cv2.VideoCapture(output_vid).get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.assertLessEqual(report['frames'], 20)
+        self.assertTrue(os.path.exists(output_vid))
+        self.assertTrue(os.path.exists(metrics_path))
+
+    def test_preview_socket(self):
+        input_vid = local_trunc_vid
+        output_vid = '{}/preview_output.avi'.format(tmp_dir.name)
+
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0))
+        receiver.settimeout(1)
+
+        stabilizer = VidStab()
+        stabilizer.stabilize(input_vid, output_vid, smoothing_window=2,
+                             preview_address=receiver.getsockname(), preview_fps=1000)
+
+        jpeg = receiver.recv(65535)
+        receiver.close()
+        preview_frame = cv2.imdecode(np.frombuffer(jpeg, dtype='uint8'), cv2.IMREAD_COLOR)
+        self.assertLessEqual(preview_frame.shape[1], 320)
+
+    def test_preview_drops_frames(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0))
+
+        preview = Preview(display=False, address=receiver.getsockname(), max_fps=5)
+        preview.start()
+        frame = np.zeros((10, 10, 3), dtype='uint8')
+        for _ in range(50):
+            preview.update(frame)
+            time.sleep(0.001)
+        preview.stop()
+        receiver.close()
+
+        self.assertEqual(preview.frames_received, 50)
+        self.assertGreaterEqual(preview.frames_published, 1)
+        self.assertLess(preview.frames_published, preview.frames_received)
+        self.assertEqual(preview.frames_shown, 0)
+
+    def test_astabilize(self):
+        input_vid = local_trunc_vid
+        progress = []
+
+        async def consume(stabilizer):
+            frames = []
+            async for frame in stabilizer.astabilize(input_vid, smoothing_window=2,
+                                                     progress_callback=lambda i, n: progress.append(i)):
+                frames.append(frame)
+            return frames
+
+        stabilizer = VidStab()
+        frames = asyncio.run(consume(stabilizer))
+
+        self.assertGreater(len(frames), 0)
+        self.assertEqual(progress, list(range(1, len(frames) + 1)))
+        self.assertEqual(stabilizer.transforms.shape, stabilizer.trajectory.shape)
+        self.assertIsNone(stabilizer.vid_cap, 'capture released after astabilize')
+
+        # breaking out early releases resources once the generator is closed
+        async def consume_first(stabilizer, tmp_file):
+            agen = stabilizer.astabilize(input_vid, smoothing_window=2, output_path=tmp_file)
+            try:
+                async for _ in agen:
+                    break
+                open_after_break = stabilizer.vid_cap is not None and stabilizer.writer is not None
+            finally:
+                await agen.aclose()
+            return open_after_break
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            stabilizer = VidStab()
+            self.assertTrue(asyncio.run(consume_first(stabilizer, '{}/stable.avi'.format(tmpdir))))
+            self.assertIsNone(stabilizer.vid_cap, 'capture released after aclose')
+            self.assertIsNone(stabilizer.writer, 'writer released after aclose')
+
     def test_trajectory_transform_values(self):
         # input_vid = 'https://s3.amazonaws.com/python-vidstab/ostrich.mp4'
         input_vid = local_vid
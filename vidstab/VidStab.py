@@ -14,13 +14,83 @@ except ModuleNotFoundError:
     """)
     raise
 
+import os
+import json
 import time
+import warnings
+import asyncio
 from collections import deque
 import numpy as np
-import imutils
 import imutils.feature.factories as kp_factory
 import matplotlib.pyplot as plt
-from .utils import bfill_rolling_mean, init_progress_bar
+from .utils import bfill_rolling_mean, bfill_variable_rolling_mean, init_progress_bar, transform_inlier_ratio, \
+    GrowableArray
+from .preview import Preview
+from .autotune import DetectorAutotuner
+
+# per frame quality metrics stored alongside transforms (see VidStab.metrics)
+METRICS_DTYPE = np.dtype([('matched_kps', 'i4'),
+                          ('lk_error', 'f4'),
+                          ('inlier_ratio', 'f4'),
+                          ('fallback', '?'),
+                          ('jitter', 'f4'),
+                          ('scene_cut', '?'),
+                          ('detected_kps', 'i4'),
+                          ('kp_cap', 'i4'),
+                          ('detector_threshold', 'f4'),
+                          ('frame_ms', 'f4')])
+
+# side length of the downsampled gray frames compared for scene cut detection
+SCENE_CUT_THUMBNAIL_SIZE = 32
+# adaptive smoothing: window frames per pixel of raw motion jitter, and the smallest window used
+ADAPTIVE_SMOOTHING_FRAMES_PER_PIXEL = 5
+ADAPTIVE_SMOOTHING_MIN_WINDOW = 3
+# spacing (in pixels) of the mesh the rolling shutter correction is evaluated on before upsampling
+ROLLING_SHUTTER_MESH_STEP = 16
+
+
+def _to_ndarray(mat):
+    """convert a ``cv2.UMat`` to a numpy array (numpy arrays are returned as is)"""
+    if isinstance(mat, cv2.UMat):
+        return mat.get()
+    return mat
+
+
+def _border_settings(border_type, border_size):
+    """validate border options; returns ``(cv2 border mode, border size, negative border size)``"""
+    if border_type not in ['black', 'reflect', 'replicate', 'trail']:
+        raise ValueError('Invalid border type')
+
+    border_modes = {'black': cv2.BORDER_CONSTANT,
+                    'reflect': cv2.BORDER_REFLECT,
+                    'replicate': cv2.BORDER_REPLICATE}
+    border_mode = border_modes[border_type]
+
+    if border_size < 0:
+        neg_border_size = 100 + abs(border_size)
+        border_size = 100
+    else:
+        neg_border_size = 0
+
+    return border_mode, border_size, neg_border_size
+
+
+def _crop(frame, top, bottom, left, right):
+    """crop rows ``[top, bottom)`` and columns ``[left, right)`` of a numpy array or ``cv2.UMat``"""
+    if isinstance(frame, cv2.UMat):
+        return cv2.UMat(frame, (top, bottom), (left, right))
+    return frame[top:bottom, left:right]
+
+
+def _fill_warp_matrix(transform, transform_i, border_size, neg_border_size):
+    """fill 2x3 ``transform`` to warp an unbordered frame straight to its bordered & cropped output"""
+    cos_a, sin_a = np.cos(transform_i[2]), np.sin(transform_i[2])
+    transform[0, 0] = cos_a
+    transform[0, 1] = -sin_a
+    transform[1, 0] = sin_a
+    transform[1, 1] = cos_a
+    transform[0, 2] = transform_i[0] + 2 * border_size * (cos_a - sin_a) - border_size - neg_border_size
+    transform[1, 2] = transform_i[1] + 2 * border_size * (sin_a + cos_a) - border_size - neg_border_size
 
 
 class VidStab:
@@ -42,17 +112,51 @@ class VidStab:
                         ``["SIFT", "SURF"]`` are additional non-free options available depending
                         on your build of OpenCV.  The non-free detectors are not tested with this package.
     :param args: Positional arguments for keypoint detector.
+    :param memmap_dir: If not ``None``, trajectory & transform data is stored in memory mapped temporary files
+                       in this directory instead of RAM (useful for very long inputs).
+    :param use_opencl: If ``True``, frames are kept as ``cv2.UMat`` during processing so OpenCV's transparent
+                       API can use an available OpenCL device.  Frames are only converted to numpy arrays
+                       when written or passed to ``layer_func``.  Falls back to plain numpy processing
+                       if OpenCL isn't available.
+    :param target_kps: If not ``None``, the detector's threshold is tuned frame by frame (and warm-started on
+                       the first frame) to find about this many keypoints, and at most this many are kept.
+    :param frame_budget_ms: If not ``None``, the number of keypoints kept is lowered whenever analysing a
+                            frame takes longer than this many milliseconds (implies autotuning; ``target_kps``
+                            defaults to 200).
     :param kwargs: Keyword arguments for keypoint detector.
 
     :ivar kp_method: a string naming the keypoint detector being used
     :ivar kp_detector: the keypoint detector object being used
+    :ivar kp_autotuner: the ``DetectorAutotuner`` adjusting ``kp_detector`` (``None`` without autotuning)
+    :ivar use_opencl: is OpenCL (``cv2.UMat``) processing being used
     :ivar trajectory: a 2d showing the trajectory of the input video
     :ivar smoothed_trajectory: a 2d numpy array showing the smoothed trajectory of the input video
     :ivar transforms: a 2d numpy array storing the transformations used from frame to frame
+    :ivar metrics: a numpy structured array of per frame quality metrics aligned with ``transforms``.
+                   Fields: ``matched_kps`` (keypoints tracked by optical flow), ``lk_error``
+                   (mean optical flow error of tracked keypoints), ``inlier_ratio`` (share of tracked
+                   keypoints agreeing with the estimated transform), ``fallback`` (``True`` if no transform
+                   could be estimated & a zero transform was used), ``jitter`` (pixels of camera motion
+                   left in the smoothed trajectory), ``scene_cut`` (``True`` if a hard cut was detected
+                   before the frame), ``detected_kps`` (keypoints found by the detector on the frame),
+                   ``kp_cap`` & ``detector_threshold`` (autotuner settings after the frame; ``0`` & ``nan``
+                   without autotuning), ``frame_ms`` (milliseconds spent analysing the frame)
+    :ivar segments: list of ``(start, end)`` row ranges of ``transforms`` between detected scene cuts;
+                    each segment's trajectory is smoothed independently
+    :ivar roi_boxes: a 2d numpy array of the tracked ``[x, y, w, h]`` subject box for each row of ``transforms``
+                     (``None`` unless a ``roi`` was given)
+    :ivar smoothing_windows: a 1d numpy array of the smoothing window used for each row of ``transforms``
+                             (``None`` unless ``adaptive_smoothing`` was used)
+    :ivar band_motion: a 3d numpy array of ``[dx, dy]`` motion of each horizontal band left over after the
+                       global transform, for each row of ``transforms``
+                       (``None`` unless ``rolling_shutter_bands`` was given)
+    :ivar frames_written: number of frames written by the last ``stabilize``, ``apply_transforms`` or
+                          ``apply_transforms_multi`` call (per rendition)
 
     """
 
-    def __init__(self, kp_method='GFTT', *args, **kwargs):
+    def __init__(self, kp_method='GFTT', *args, memmap_dir=None, use_opencl=False,
+                 target_kps=None, frame_budget_ms=None, **kwargs):
         """instantiate VidStab class
 
         :param kp_method: String of the type of keypoint detector to use. Available options are:
@@ -60,6 +164,12 @@ class VidStab:
                         ``["SIFT", "SURF"]`` are additional non-free options available depending
                         on your build of OpenCV.  The non-free detectors are not tested with this package.
         :param args: Positional arguments for keypoint detector.
+        :param memmap_dir: If not ``None``, trajectory & transform data is stored in memory mapped temporary
+                           files in this directory instead of RAM (useful for very long inputs).
+        :param use_opencl: Should frames be processed as ``cv2.UMat`` to make use of OpenCL?
+                           Falls back to plain numpy processing if OpenCL isn't available.
+        :param target_kps: Number of keypoints to tune the detector towards (``None`` for no autotuning).
+        :param frame_budget_ms: Per frame analysis time to cap keypoints by (``None`` for no time budget).
         :param kwargs: Keyword arguments for keypoint detector.
 
         """
@@ -75,38 +185,198 @@ class VidStab:
         else:
             self.kp_detector = kp_factory.FeatureDetector_create(kp_method, *args, **kwargs)
 
+        if target_kps is not None or frame_budget_ms is not None:
+            self.kp_autotuner = DetectorAutotuner(self.kp_detector,
+                                                  target_kps=200 if target_kps is None else target_kps,
+                                                  frame_budget_ms=frame_budget_ms)
+        else:
+            self.kp_autotuner = None
+
+        self._memmap_dir = memmap_dir
+
+        self.use_opencl = use_opencl and cv2.ocl.haveOpenCL()
+        if self.use_opencl:
+            cv2.ocl.setUseOpenCL(True)
+        elif use_opencl:
+            warnings.warn('OpenCL is not available; VidStab will process frames on the CPU.')
+
+        self.frame_queue = None
+        self.frame_queue_inds = None
+        self.vid_cap = None
+        self.writer = None
+        self.reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def reset(self):
+        """Clear all state left over from previously processed videos
+
+        Any open video capture/writer is released and stored trajectory & transform data is dropped.
+        The keypoint detector and frame buffers are kept, so a single ``VidStab`` instance can be
+        reused to process many videos back to back without re-initialization.
+
+        :return: Nothing is returned.
+
+        >>> from vidstab import VidStab
+        >>> stabilizer = VidStab()
+        >>> stabilizer.gen_transforms(input_path='input_video.mov')
+        >>> stabilizer.reset()
+        >>> stabilizer.gen_transforms(input_path='other_input_video.mov')
+        """
+        self.release()
+
         self._smoothing_window = None
-        self._raw_transforms = []
-        self._trajectory = []
+        self._scene_cut_threshold = None
+        self._roi = None
+        self._roi_box = None
+        self._rolling_shutter_bands = None
+        self._frame_shape = None
+        self._rs_maps = {}
+        self._prev_thumbnail = None
+        self._segment_starts = [0]
+        self._checkpoint_path = None
+        self._checkpoint_interval = None
+        self._checkpoint_run_info = None
+        # new stores each run so arrays handed out for a previous video are never overwritten
+        self._raw_transforms = GrowableArray((3,), memmap_dir=self._memmap_dir)
+        self._raw_metrics = GrowableArray(dtype=METRICS_DTYPE, memmap_dir=self._memmap_dir)
+        self._trajectory = GrowableArray((3,), memmap_dir=self._memmap_dir)
+        self._smoothed_trajectory = GrowableArray((3,), memmap_dir=self._memmap_dir)
+        self._transforms = GrowableArray((3,), memmap_dir=self._memmap_dir)
+        self._roi_boxes = GrowableArray((4,), memmap_dir=self._memmap_dir)
+        # rolling shutter stores are created once the number of bands is known
+        self._band_motion = None
+        self._band_trajectory = None
+        self._smoothed_band_trajectory = None
+        self._n_smoothed_final = 0
         self.trajectory = None
         self.smoothed_trajectory = None
         self.transforms = None
-        self.frame_queue = None
-        self.frame_queue_inds = None
+        self.metrics = None
+        self.segments = None
+        self.roi_boxes = None
+        self.band_motion = None
+        self.smoothing_windows = None
+        self.frames_written = 0
         self.prev_kps = None
         self.prev_gray = None
-        self.vid_cap = None
-        self.writer = None
 
-    def _gen_next_raw_transform(self):
-        current_frame_gray = cv2.cvtColor(self.frame_queue[-1], cv2.COLOR_BGR2GRAY)
+        if self.frame_queue is not None:
+            self.frame_queue.clear()
+            self.frame_queue_inds.clear()
+
+    def release(self):
+        """Release the video capture & video writer held by the stabilizer
+
+        Called automatically at the end of ``stabilize`` & ``gen_transforms`` (even if they fail)
+        and when exiting a ``with`` block.  Stored trajectory & transform data is left untouched.
 
+        :return: Nothing is returned.
+
+        >>> from vidstab import VidStab
+        >>> with VidStab() as stabilizer:
+        ...     stabilizer.stabilize(input_path='input_video.mov', output_path='stable_video.avi')
+        """
+        if self.vid_cap is not None:
+            self.vid_cap.release()
+            self.vid_cap = None
+
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+    def _read_frame(self):
+        grabbed_frame, frame = self.vid_cap.read()
+        if grabbed_frame and self.use_opencl:
+            frame = cv2.UMat(frame)
+
+        return grabbed_frame, frame
+
+    def _set_roi(self, roi, frame_shape=None):
+        """store subject box; raises ``ValueError`` if it's empty or (given ``frame_shape``) outside the frame"""
+        if roi is None:
+            self._roi = self._roi_box = None
+            return
+
+        x, y, w, h = roi
+        if w <= 0 or h <= 0:
+            raise ValueError('roi width & height must be positive; got {}'.format(tuple(roi)))
+        if frame_shape is not None:
+            frame_h, frame_w = frame_shape[:2]
+            if x >= frame_w or y >= frame_h or x + w <= 0 or y + h <= 0:
+                raise ValueError('roi {} does not overlap the {}x{} frame'.format(tuple(roi), frame_w, frame_h))
+
+        self._roi = tuple(roi)
+        self._roi_box = np.array(roi, dtype='float64')
+
+    def _set_rolling_shutter(self, rolling_shutter_bands):
+        if rolling_shutter_bands and self._band_motion is None:
+            row_shape = (rolling_shutter_bands, 2)
+            self._band_motion = GrowableArray(row_shape, memmap_dir=self._memmap_dir)
+            self._band_trajectory = GrowableArray(row_shape, memmap_dir=self._memmap_dir)
+            self._smoothed_band_trajectory = GrowableArray(row_shape, memmap_dir=self._memmap_dir)
+
+    def _init_frame_queue(self, smoothing_window):
+        # reuse existing buffers when the window size hasn't changed
+        if self.frame_queue is None or self.frame_queue.maxlen != smoothing_window:
+            self.frame_queue = deque(maxlen=smoothing_window)
+            self.frame_queue_inds = deque(maxlen=smoothing_window)
+        else:
+            self.frame_queue.clear()
+            self.frame_queue_inds.clear()
+
+    def _detect_keypoints(self, frame_gray, warm_start=False):
+        offset = (0, 0)
+        if self._roi_box is not None:
+            # only track keypoints on the subject
+            frame_gray = _to_ndarray(frame_gray)
+            frame_h, frame_w = frame_gray.shape[:2]
+            x, y, w, h = self._roi_box
+            x0 = int(min(max(x, 0), frame_w - 1))
+            y0 = int(min(max(y, 0), frame_h - 1))
+            x1 = int(min(max(x + w, x0 + 1), frame_w))
+            y1 = int(min(max(y + h, y0 + 1), frame_h))
+            frame_gray = frame_gray[y0:y1, x0:x1]
+            offset = (x0, y0)
+        elif not isinstance(self.kp_detector, cv2.Feature2D):
+            # imutils' python wrapped detectors (e.g. GFTT) can't handle cv2.UMat input
+            frame_gray = _to_ndarray(frame_gray)
+
+        if self.kp_autotuner is not None:
+            kps = self.kp_autotuner.detect(frame_gray, warm_start=warm_start)
+        else:
+            kps = self.kp_detector.detect(frame_gray)
+        kps = np.array([kp.pt for kp in kps], dtype='float32').reshape(-1, 1, 2)
+        kps += np.array(offset, dtype='float32')
+
+        return kps
+
+    def _estimate_transform(self, current_frame_gray):
         # calc flow of movement
-        cur_kps, status, err = cv2.calcOpticalFlowPyrLK(self.prev_gray,
-                                                        current_frame_gray,
-                                                        self.prev_kps, None)
-        # storage for keypoints with status 1
-        prev_matched_kp = []
-        cur_matched_kp = []
-        for i, matched in enumerate(status):
+        if len(self.prev_kps):
+            cur_kps, status, err = cv2.calcOpticalFlowPyrLK(self.prev_gray,
+                                                            current_frame_gray,
+                                                            self.prev_kps, None)
+            cur_kps, status, err = _to_ndarray(cur_kps), _to_ndarray(status), _to_ndarray(err)
             # store coords of keypoints that appear in both
-            if matched:
-                prev_matched_kp.append(self.prev_kps[i])
-                cur_matched_kp.append(cur_kps[i])
+            matched = status.ravel() == 1
+        else:
+            # nothing to track (e.g. a flat subject); LK returns no status for empty input
+            cur_kps, err = self.prev_kps, np.empty((0, 1), dtype='float32')
+            matched = np.zeros(0, dtype=bool)
+        prev_matched_kp = self.prev_kps[matched]
+        cur_matched_kp = cur_kps[matched]
         # estimate partial transform
-        transform = cv2.estimateRigidTransform(np.array(prev_matched_kp),
-                                               np.array(cur_matched_kp),
-                                               False)
+        if len(prev_matched_kp):
+            transform = cv2.estimateRigidTransform(prev_matched_kp,
+                                                   cur_matched_kp,
+                                                   False)
+        else:
+            transform = None
         if transform is not None:
             # translation x
             dx = transform[0, 2]
@@ -117,48 +387,169 @@ class VidStab:
         else:
             dx = dy = da = 0
 
+        n_matched = int(matched.sum())
+        if self._roi_box is not None and n_matched:
+            # follow the subject with the median flow of its keypoints; a rigid fit's translation
+            # is relative to the frame origin and trades off against rotation on a small box
+            dx, dy = np.median(cur_matched_kp - prev_matched_kp, axis=0).ravel()
+            self._roi_box[:2] += (dx, dy)
+
         transform_i = [dx, dy, da]
 
+        if self._band_motion is not None:
+            self._band_motion.append(self._estimate_band_motion(current_frame_gray, transform,
+                                                                prev_matched_kp, cur_matched_kp))
+
+        self._raw_metrics.append((n_matched,
+                                  err[matched].mean() if n_matched else np.nan,
+                                  transform_inlier_ratio(transform, prev_matched_kp, cur_matched_kp),
+                                  transform is None,
+                                  0,
+                                  False,
+                                  0, 0, np.nan, np.nan))
+
+        return transform_i
+
+    def _estimate_band_motion(self, frame_gray, transform, prev_pts, cur_pts):
+        """median motion of the tracked keypoints in each horizontal band not explained by ``transform``"""
+        n_bands = self._band_motion.row_shape[0]
+        band_motion = np.zeros((n_bands, 2))
+        if transform is None:
+            return band_motion
+
+        prev_pts = prev_pts.reshape(-1, 2)
+        cur_pts = cur_pts.reshape(-1, 2)
+        residuals = cur_pts - (prev_pts.dot(transform[:, :2].T) + transform[:, 2])
+
+        bands = (cur_pts[:, 1] * n_bands / self._frame_height(frame_gray)).astype(int)
+        bands = np.clip(bands, 0, n_bands - 1)
+        tracked = np.zeros(n_bands, dtype=bool)
+        for band in np.unique(bands):
+            band_motion[band] = np.median(residuals[bands == band], axis=0)
+            tracked[band] = True
+
+        # bands without any keypoints take the motion of their neighbours
+        if tracked.any() and not tracked.all():
+            band_inds = np.arange(n_bands)
+            for j in range(2):
+                band_motion[~tracked, j] = np.interp(band_inds[~tracked], band_inds[tracked],
+                                                     band_motion[tracked, j])
+
+        return band_motion
+
+    def _is_scene_cut(self, frame_gray):
+        if self._scene_cut_threshold is None:
+            return False
+
+        thumbnail = cv2.resize(frame_gray, (SCENE_CUT_THUMBNAIL_SIZE, SCENE_CUT_THUMBNAIL_SIZE),
+                               interpolation=cv2.INTER_AREA)
+        prev_thumbnail = self._prev_thumbnail
+        self._prev_thumbnail = thumbnail
+
+        if prev_thumbnail is None:
+            return False
+
+        mean_abs_diff = cv2.norm(thumbnail, prev_thumbnail, cv2.NORM_L1) / SCENE_CUT_THUMBNAIL_SIZE ** 2
+        return mean_abs_diff > self._scene_cut_threshold
+
+    def _gen_next_raw_transform(self):
+        frame_start = time.perf_counter()
+        current_frame_gray = cv2.cvtColor(self.frame_queue[-1], cv2.COLOR_BGR2GRAY)
+
+        if self._is_scene_cut(current_frame_gray):
+            # flow across a cut is meaningless; start a new independently smoothed segment
+            if self._raw_transforms:
+                self._segment_starts.append(len(self._raw_transforms))
+            transform_i = [0, 0, 0]
+            self._raw_metrics.append((0, np.nan, 0.0, False, 0, True, 0, 0, np.nan, np.nan))
+            if self._band_motion is not None:
+                self._band_motion.append(0)
+        else:
+            transform_i = self._estimate_transform(current_frame_gray)
+
         # update previous frame info for next iteration
-        self.prev_gray = current_frame_gray[:]
-        self.prev_kps = self.kp_detector.detect(self.prev_gray)
-        self.prev_kps = np.array([kp.pt for kp in self.prev_kps], dtype='float32').reshape(-1, 1, 2)
-        self._raw_transforms.append(transform_i[:])
+        self.prev_gray = current_frame_gray
+        # the detector is warm-started again on the first frame of a new scene
+        self.prev_kps = self._detect_keypoints(self.prev_gray, warm_start=self._raw_metrics[-1]['scene_cut'])
+        self._record_detector_metrics(time.perf_counter() - frame_start)
+        self._raw_transforms.append(transform_i)
+        if self._roi_box is not None:
+            self._roi_boxes.append(self._roi_box)
 
         if not self._trajectory:
-            self._trajectory.append(transform_i[:])
+            self._trajectory.append(transform_i)
         else:
             # gen cumsum for new row and append
-            self._trajectory.append([self._trajectory[-1][j] + x for j, x in enumerate(transform_i)])
+            self._trajectory.append(self._trajectory[-1] + transform_i)
+
+        if self._band_motion is not None:
+            if not self._band_trajectory:
+                self._band_trajectory.append(self._band_motion[-1])
+            else:
+                self._band_trajectory.append(self._band_trajectory[-1] + self._band_motion[-1])
 
         return
 
-    def _init_trajectory(self, smoothing_window, max_frames, gen_all=False, show_progress=False):
+    def _record_detector_metrics(self, frame_seconds):
+        """fill the keypoint detector fields of the latest metrics row & let the autotuner react to its cost"""
+        row = self._raw_metrics[-1]
+        row['frame_ms'] = frame_seconds * 1000
+        row['detected_kps'] = len(self.prev_kps)
+        if self.kp_autotuner is not None:
+            self.kp_autotuner.record_frame_time(row['frame_ms'])
+            row['detected_kps'] = self.kp_autotuner.n_detected
+            row['kp_cap'] = self.kp_autotuner.cap
+            row['detector_threshold'] = self.kp_autotuner.threshold
+
+    def _init_trajectory(self, smoothing_window, max_frames, gen_all=False, show_progress=False,
+                         use_stored_transforms=False):
         """
 
         :param smoothing_window: window size to use when smoothing trajectory
         :param max_frames: max number of frames to process
+        :param use_stored_transforms: only fill the frame queue; stored transforms are left as they are
         :return:
         """
         frame_count = int(self.vid_cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
         if gen_all:
             message = 'Generating Transforms'
+            bar = init_progress_bar(frame_count, max_frames, show_progress, message)
         else:
             message = 'Stabilizing'
-        bar = init_progress_bar(frame_count, max_frames, show_progress, message)
+            # frames are counted as they're written; the first frame (and the second once the frame queue
+            # has filled up) is never output
+            n_outputs = frame_count - 2 if frame_count > smoothing_window else frame_count - 1
+            bar = init_progress_bar(n_outputs if frame_count > 0 else frame_count, max_frames,
+                                    show_progress, message)
+
+        start_frame = self._load_checkpoint()
+        if start_frame:
+            # continue from the last frame processed before the checkpoint was saved
+            self.vid_cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+            self.frame_queue_inds.append(start_frame - 1)
+            if bar is not None:
+                bar.next(start_frame)
 
         # read first frame
-        grabbed_frame, prev_frame = self.vid_cap.read()
-        # convert to gray scale
-        prev_frame_gray = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
-        # detect keypoints
-        prev_kps = self.kp_detector.detect(prev_frame_gray)
-        self.prev_kps = np.array([kp.pt for kp in prev_kps], dtype='float32').reshape(-1, 1, 2)
+        grabbed_frame, prev_frame = self._read_frame()
+        if not grabbed_frame:
+            raise ValueError('Could not read frame {} of input video'.format(start_frame))
+        if self._roi is not None and not start_frame:
+            # the frame size is only known once a frame has been read
+            self._set_roi(self._roi, _to_ndarray(prev_frame).shape)
+        if not use_stored_transforms:
+            # convert to gray scale
+            prev_frame_gray = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
+            # detect keypoints
+            self.prev_kps = self._detect_keypoints(prev_frame_gray, warm_start=True)
+
+            # seed scene cut detection with first frame
+            self._is_scene_cut(prev_frame_gray)
+            self.prev_gray = prev_frame_gray
 
         # store frame
         self.frame_queue.append(prev_frame)
-        self.prev_gray = prev_frame_gray[:]
 
         if max_frames is None:
             max_frames = float('inf')
@@ -168,7 +559,7 @@ class VidStab:
 
         while grabbed_frame:
             # read current frame
-            grabbed_frame, cur_frame = self.vid_cap.read()
+            grabbed_frame, cur_frame = self._read_frame()
             if not grabbed_frame:
                 if show_progress and bar is not None:
                     bar.next()
@@ -179,20 +570,145 @@ class VidStab:
                 self.frame_queue_inds.append(0)
             else:
                 self.frame_queue_inds.append(self.frame_queue_inds[-1] + 1)
-            self._gen_next_raw_transform()
+            if not use_stored_transforms:
+                self._gen_next_raw_transform()
+
+                if self._checkpoint_path is not None and len(self._raw_transforms) % self._checkpoint_interval == 0:
+                    self._save_checkpoint()
 
             if not gen_all:
                 if (self.frame_queue_inds[-1] >= max_frames - 1 or
                         self.frame_queue_inds[-1] >= smoothing_window - 1):
                     break
 
-            if show_progress and bar is not None:
+            # when stabilizing, frames are counted as they are written instead
+            if gen_all and show_progress and bar is not None:
                 bar.next()
 
-        self._gen_transforms(smoothing_window)
+        if not use_stored_transforms:
+            self._gen_transforms(smoothing_window)
 
         return bar
 
+    def _save_checkpoint(self):
+        # write to a temp file first so a crash mid-save never corrupts the last good checkpoint
+        tmp_path = '{}.tmp'.format(self._checkpoint_path)
+        with open(tmp_path, 'wb') as f:
+            np.savez(f,
+                     raw_transforms=self._raw_transforms.view(),
+                     trajectory=self._trajectory.view(),
+                     metrics=self._raw_metrics.view(),
+                     segment_starts=np.array(self._segment_starts),
+                     roi_boxes=self._roi_boxes.view(),
+                     run_info=np.array(self._checkpoint_run_info),
+                     **self._band_checkpoint_arrays())
+        os.replace(tmp_path, self._checkpoint_path)
+
+    def _band_checkpoint_arrays(self):
+        if self._band_motion is None:
+            return {}
+
+        return {'band_motion': self._band_motion.view(), 'band_trajectory': self._band_trajectory.view()}
+
+    def _run_info(self, input_path):
+        """JSON string identifying an input video & the options that affect its analysis"""
+        return json.dumps({'input_path': str(input_path),
+                           'frame_count': int(self.vid_cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+                           'frame_size': [int(self.vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                          int(self.vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))],
+                           'smoothing_window': self._smoothing_window,
+                           'scene_cut_threshold': self._scene_cut_threshold,
+                           'roi': list(self._roi) if self._roi is not None else None,
+                           'rolling_shutter_bands': self._rolling_shutter_bands,
+                           'kp_method': self.kp_method}, sort_keys=True)
+
+    def _load_checkpoint(self):
+        """restore analysis state from checkpoint file (if any); returns index of the frame to resume from"""
+        if self._checkpoint_path is None or not os.path.exists(self._checkpoint_path):
+            return 0
+
+        with np.load(self._checkpoint_path) as checkpoint:
+            if 'run_info' not in checkpoint or str(checkpoint['run_info']) != self._checkpoint_run_info:
+                raise ValueError('Checkpoint {} was saved for a different input video or different analysis '
+                                 'options; remove it to start over'.format(self._checkpoint_path))
+
+            self._raw_transforms.extend(checkpoint['raw_transforms'])
+            self._trajectory.extend(checkpoint['trajectory'])
+            self._raw_metrics.extend(checkpoint['metrics'])
+            self._segment_starts = [int(x) for x in checkpoint['segment_starts']]
+            self._roi_boxes.extend(checkpoint['roi_boxes'])
+            if self._band_motion is not None and 'band_motion' in checkpoint:
+                self._band_motion.extend(checkpoint['band_motion'])
+                self._band_trajectory.extend(checkpoint['band_trajectory'])
+
+        if self._roi_box is not None and len(self._roi_boxes):
+            self._roi_box = self._roi_boxes[-1].copy()
+
+        return len(self._raw_transforms)
+
+    def _frame_height(self, frame):
+        if self._frame_shape is None:
+            self._frame_shape = _to_ndarray(frame).shape[:2]
+
+        return self._frame_shape[0]
+
+    def _rolling_shutter_warp(self, frame, i, transform, output_size, border_mode):
+        """warp ``frame`` by ``transform`` with each source row shifted by the smoothed correction of its band;
+        both are combined into the maps of a single ``cv2.remap``"""
+        maps = self._rs_maps.get(output_size)
+        if maps is None:
+            # full size maps are allocated once per output size and updated in place
+            out_w, out_h = output_size
+            mesh_w = max(out_w // ROLLING_SHUTTER_MESH_STEP, 2)
+            mesh_h = max(out_h // ROLLING_SHUTTER_MESH_STEP, 2)
+            # output pixels that cv2.resize samples the mesh at
+            mesh_u = (np.arange(mesh_w) + 0.5) * out_w / mesh_w - 0.5
+            mesh_v = (np.arange(mesh_h) + 0.5) * out_h / mesh_h - 0.5
+            maps = (np.arange(out_w, dtype='float32'), np.arange(out_h, dtype='float32'), mesh_u, mesh_v,
+                    np.empty((out_h, out_w), dtype='float32'), np.empty((out_h, out_w), dtype='float32'))
+            self._rs_maps[output_size] = maps
+
+        cols, rows, mesh_u, mesh_v, map_x, map_y = maps
+        inverse = cv2.invertAffineTransform(transform)
+
+        # the correction changes slowly across the frame so it's evaluated on a coarse mesh of source rows
+        n_bands = self._band_motion.row_shape[0]
+        band_centers = (np.arange(n_bands) + 0.5) * self._frame_height(frame) / n_bands
+        correction = self._smoothed_band_trajectory[i] - self._band_trajectory[i]
+        mesh_rows = inverse[1, 0] * mesh_u[None, :] + inverse[1, 1] * mesh_v[:, None] + inverse[1, 2]
+
+        # content is moved by the correction, so sample from the opposite direction
+        for j, map_j in enumerate((map_x, map_y)):
+            np.add(inverse[j, 0] * cols[None, :], (inverse[j, 1] * rows + inverse[j, 2])[:, None], out=map_j)
+            mesh_correction = np.interp(mesh_rows, band_centers, correction[:, j]).astype('float32')
+            map_j -= cv2.resize(mesh_correction, output_size, interpolation=cv2.INTER_LINEAR)
+
+        return cv2.remap(frame, map_x, map_y, cv2.INTER_LINEAR, borderMode=border_mode)
+
+    def _roi_output_size(self, border_offset):
+        return (int(self._roi[2]) + 2 * border_offset,
+                int(self._roi[3]) + 2 * border_offset)
+
+    def _roi_crop_origin(self, i, output_size):
+        """top left of the output crop window centered on the smoothed subject path"""
+        x, y, w, h = self._roi
+        return np.array([x + w / 2.0 + self.smoothed_trajectory[i, 0] - output_size[0] / 2.0,
+                         y + h / 2.0 + self.smoothed_trajectory[i, 1] - output_size[1] / 2.0])
+
+    def _roi_warp_matrix(self, i, transform, output_size):
+        """fill ``transform`` to rotate frame ``i`` about the subject and crop a window of ``output_size``
+        centered on the smoothed subject path"""
+        x, y, w, h = self.roi_boxes[i]
+        center = np.array([x + w / 2.0, y + h / 2.0])
+        da = self.smoothed_trajectory[i, 2] - self.trajectory[i, 2]
+        origin = self._roi_crop_origin(i, output_size)
+
+        transform[0, 0] = np.cos(da)
+        transform[0, 1] = -np.sin(da)
+        transform[1, 0] = np.sin(da)
+        transform[1, 1] = np.cos(da)
+        transform[:, 2] = center - transform[:, :2].dot(center) - origin
+
     def _init_writer(self, output_path, frame_shape, output_fourcc, fps):
         # set output and working dims
         h, w = frame_shape
@@ -202,24 +718,15 @@ class VidStab:
                                       cv2.VideoWriter_fourcc(*output_fourcc),
                                       fps, (w, h), True)
 
-    def _apply_transforms(self, output_path, max_frames, smoothing_window, output_fourcc='MJPG',
-                          border_type='black', border_size=0, layer_func=None, playback=False, progress_bar=None):
-
-        if border_type not in ['black', 'reflect', 'replicate', 'trail']:
-            raise ValueError('Invalid border type')
-
-        border_modes = {'black': cv2.BORDER_CONSTANT,
-                        'reflect': cv2.BORDER_REFLECT,
-                        'replicate': cv2.BORDER_REPLICATE}
-        border_mode = border_modes[border_type]
+    def _stabilized_frames(self, max_frames, smoothing_window, border_type='black', border_size=0,
+                           layer_func=None, use_stored_transforms=False):
+        """generator yielding ``(input_frame, stabilized_frame)`` pairs; frames are read as they are needed
 
-        if border_size < 0:
-            neg_border_size = 100 + abs(border_size)
-            border_size = 100
-        else:
-            neg_border_size = 0
+        stabilized frames are always numpy arrays; input frames are ``cv2.UMat`` when ``use_opencl`` is set
+        """
+        border_mode, border_size, neg_border_size = _border_settings(border_type, border_size)
 
-        prev_frame = self.frame_queue.popleft()
+        prev_frame = _to_ndarray(self.frame_queue.popleft())
         (h, w) = prev_frame.shape[:2]
         h += 2 * border_size
         w += 2 * border_size
@@ -228,47 +735,62 @@ class VidStab:
         transform = np.zeros((2, 3))
         grabbed_frame = True
         while len(self.frame_queue) > 0 or grabbed_frame:
-            if progress_bar:
-                progress_bar.next()
-
-            grabbed_frame, next_frame = self.vid_cap.read()
+            grabbed_frame, next_frame = self._read_frame()
             if grabbed_frame:
                 self.frame_queue.append(next_frame)
                 self.frame_queue_inds.append(self.frame_queue_inds[-1] + 1)
-                self._gen_next_raw_transform()
-                self._gen_transforms(smoothing_window=smoothing_window)
+                if not use_stored_transforms:
+                    self._gen_next_raw_transform()
+                    self._gen_transforms(smoothing_window=smoothing_window)
 
             i = self.frame_queue_inds.popleft()
             frame_i = self.frame_queue.popleft()
-            transform_i = self.transforms[i, :]
 
-            if i >= max_frames:
+            if i >= max_frames or i >= len(self.transforms):
                 break
 
-            # build transformation matrix
-            transform[0, 0] = np.cos(transform_i[2])
-            transform[0, 1] = -np.sin(transform_i[2])
-            transform[1, 0] = np.sin(transform_i[2])
-            transform[1, 1] = np.cos(transform_i[2])
-            transform[0, 2] = transform_i[0]
-            transform[1, 2] = transform_i[1]
-
-            # apply transform
-            bordered_frame = cv2.copyMakeBorder(frame_i,
-                                                top=border_size * 2,
-                                                bottom=border_size * 2,
-                                                left=border_size * 2,
-                                                right=border_size * 2,
-                                                borderType=border_mode,
-                                                value=[0, 0, 0])
-            transformed = cv2.warpAffine(bordered_frame,
-                                         transform,
-                                         (w + border_size * 2, h + border_size * 2),
-                                         borderMode=border_mode)
-
-            buffer = border_size + neg_border_size
-            transformed = transformed[buffer:(transformed.shape[0] - buffer),
-                                      buffer:(transformed.shape[1] - buffer)]
+            transform_i = self.transforms[i, :]
+
+            if self._roi is not None:
+                # fold the subject crop into the warp
+                output_size = self._roi_output_size(border_size - neg_border_size)
+                self._roi_warp_matrix(i, transform, output_size)
+            elif self._band_motion is not None:
+                output_size = (w - 2 * neg_border_size, h - 2 * neg_border_size)
+                _fill_warp_matrix(transform, transform_i, border_size, neg_border_size)
+
+            if self._band_motion is not None:
+                transformed = self._rolling_shutter_warp(frame_i, i, transform, output_size, border_mode)
+            elif self._roi is not None:
+                transformed = cv2.warpAffine(frame_i, transform, output_size, borderMode=border_mode)
+            else:
+                # build transformation matrix
+                transform[0, 0] = np.cos(transform_i[2])
+                transform[0, 1] = -np.sin(transform_i[2])
+                transform[1, 0] = np.sin(transform_i[2])
+                transform[1, 1] = np.cos(transform_i[2])
+                transform[0, 2] = transform_i[0]
+                transform[1, 2] = transform_i[1]
+
+                # apply transform
+                bordered_frame = cv2.copyMakeBorder(frame_i,
+                                                    top=border_size * 2,
+                                                    bottom=border_size * 2,
+                                                    left=border_size * 2,
+                                                    right=border_size * 2,
+                                                    borderType=border_mode,
+                                                    value=[0, 0, 0])
+                transformed = cv2.warpAffine(bordered_frame,
+                                             transform,
+                                             (w + border_size * 2, h + border_size * 2),
+                                             borderMode=border_mode)
+
+                buffer = border_size + neg_border_size
+                transformed = _crop(transformed,
+                                    buffer, h + border_size * 2 - buffer,
+                                    buffer, w + border_size * 2 - buffer)
+
+            transformed = _to_ndarray(transformed)
 
             if layer_func is not None:
                 if i > 1:
@@ -276,62 +798,352 @@ class VidStab:
 
                 prev_frame = transformed[:]
 
-            if playback:
-                # resized_frame = imutils.resize(frame_i, width=min([frame_i.shape[0], 500]))
-                # resized_transformed = imutils.resize(transformed, width=min([frame_i.shape[0], 500]))
-                # playback_frame = np.hstack((resized_frame, resized_transformed))
-
-                resized_transformed = imutils.resize(transformed, width=min([frame_i.shape[0], 1000]))
-                playback_frame = resized_transformed
+            yield frame_i, transformed
 
-                cv2.imshow('VidStab Playback ({} frame delay if using live video;'
-                           ' press Q or ESC to quit)'.format(min([smoothing_window,
-                                                                 max_frames])),
-                           playback_frame)
-                key = cv2.waitKey(1)
-
-                if key == ord("q") or key == 27:
-                    break
-
-            if self.writer is None:
-                self._init_writer(output_path, transformed.shape[:2], output_fourcc,
-                                  fps=int(self.vid_cap.get(cv2.CAP_PROP_FPS)))
-
-            # write frame to output video
-            self.writer.write(transformed)
+    def _apply_transforms(self, output_path, max_frames, smoothing_window, output_fourcc='MJPG',
+                          border_type='black', border_size=0, layer_func=None, playback=False, progress_bar=None,
+                          preview_address=None, preview_fps=15, use_stored_transforms=False):
+
+        stabilized_frames = self._stabilized_frames(max_frames, smoothing_window,
+                                                    border_type=border_type,
+                                                    border_size=border_size,
+                                                    layer_func=layer_func,
+                                                    use_stored_transforms=use_stored_transforms)
+
+        # frames are shown/published from a separate thread so display never throttles processing
+        preview = None
+        if playback or preview_address is not None:
+            preview = Preview(display=playback, address=preview_address, max_fps=preview_fps,
+                              window_name='VidStab Playback ({} frame delay if using live video;'
+                                          ' press Q or ESC to quit)'.format(min([smoothing_window, max_frames])))
+            preview.start()
+
+        quit_requested = False
+        self.frames_written = 0
+        try:
+            for frame_i, transformed in stabilized_frames:
+                if preview is not None:
+                    if preview.quit_requested:
+                        quit_requested = True
+                        break
+                    preview.update(transformed)
+
+                if self.writer is None:
+                    self._init_writer(output_path, transformed.shape[:2], output_fourcc,
+                                      fps=int(self.vid_cap.get(cv2.CAP_PROP_FPS)))
+
+                # write frame to output video
+                self.writer.write(transformed)
+                self.frames_written += 1
+
+                if progress_bar:
+                    progress_bar.next()
+        finally:
+            stabilized_frames.close()
+            if preview is not None:
+                preview.stop()
 
-        self.writer.release()
         if progress_bar:
-            progress_bar.next()
+            if not quit_requested:
+                # the total is estimated from cv2.CAP_PROP_FRAME_COUNT (& max_frames); report what was written
+                progress_bar.max = progress_bar.index
             progress_bar.finish()
 
     def apply_transforms(self, input_path, output_path, output_fourcc='MJPG',
-                         border_type='black', border_size=0, layer_func=None, show_progress=True, playback=False):
+                         border_type='black', border_size=0, layer_func=None, show_progress=True, playback=False,
+                         preview_address=None, preview_fps=15):
+        """Write a stabilized video using the transforms stored by ``gen_transforms``
+
+        The input isn't re-analysed, so options used when generating the transforms (e.g. ``roi``,
+        ``rolling_shutter_bands`` or ``adaptive_smoothing``) carry over to the output.  Output frames match
+        ``stabilize`` with the same options.  See ``stabilize`` for descriptions of the other parameters.
+
+        :param input_path: Path to input video the transforms were generated from.
+        :param output_path: Path to save stabilized video.
+        :return: Nothing is returned.  Output is written to ``output_path``.
+
+        >>> from vidstab import VidStab
+        >>> stabilizer = VidStab()
+        >>> stabilizer.gen_transforms(input_path='input_video.mov', adaptive_smoothing=True)
+        >>> stabilizer.apply_transforms(input_path='input_video.mov', output_path='stable_video.avi')
+        """
         self.stabilize(input_path, output_path, smoothing_window=self._smoothing_window, max_frames=float('inf'),
                        border_type=border_type, border_size=border_size, layer_func=layer_func, playback=playback,
-                       use_stored_transforms=False, show_progress=show_progress, output_fourcc=output_fourcc)
+                       preview_address=preview_address, preview_fps=preview_fps,
+                       use_stored_transforms=True, show_progress=show_progress, output_fourcc=output_fourcc,
+                       scene_cut_threshold=self._scene_cut_threshold, roi=self._roi,
+                       rolling_shutter_bands=self._rolling_shutter_bands)
+
+    def apply_transforms_multi(self, input_path, renditions, border_type='black', border_size=0,
+                               show_progress=True):
+        """Write several stabilized renditions of a video in a single pass
+
+        Uses the transforms stored by ``gen_transforms``.  Each input frame is decoded once and warped
+        directly to each rendition's size with a single ``cv2.warpAffine`` (the transform is scaled per
+        rendition), so there is no re-decoding or separate resize step per output.
+
+        :param input_path: Path to input video the transforms were generated from.
+        :param renditions: list of dicts describing outputs.  Keys:
+                           ``output_path`` (required) path to save rendition to,
+                           ``width`` & ``height`` of output (if only one is given the other is set to preserve
+                           aspect ratio; if neither is given the full size output is written),
+                           ``output_fourcc`` codec for output (default ``'MJPG'``).
+        :param border_type: How to handle border when rotations are needed to stabilize.
+                            Options: ``['black', 'reflect', 'replicate']``
+        :param border_size: size of border in full size output (scaled with each rendition)
+        :param show_progress: Should a progress bar be displayed to console?  If ``'json'``, progress is
+                              printed as JSON lines instead (see ``vidstab.utils.JsonProgressBar``).
+        :return: Nothing is returned.  Output is written to each rendition's ``output_path``.
+
+        >>> from vidstab import VidStab
+        >>> stabilizer = VidStab()
+        >>> stabilizer.gen_transforms(input_path='input_video.mov')
+        >>> stabilizer.apply_transforms_multi('input_video.mov',
+        ...                                   [{'output_path': 'stable_2160p.avi', 'height': 2160},
+        ...                                    {'output_path': 'stable_1080p.avi', 'height': 1080},
+        ...                                    {'output_path': 'stable_480p.avi', 'height': 480,
+        ...                                     'output_fourcc': 'XVID'}])
+        """
+        if self.transforms is None:
+            raise AttributeError('No transforms to apply. '
+                                 'Use method gen_transforms to generate the transforms attribute')
+
+        border_mode, border_size, neg_border_size = _border_settings(border_type, border_size)
+        # offset of output origin in original frame coords (see _stabilized_frames border & crop)
+        border_offset = border_size - neg_border_size
+
+        self.release()
+        self.frames_written = 0
+        self.vid_cap = cv2.VideoCapture(input_path)
+        writers = []
+        try:
+            frame_count = int(self.vid_cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            fps = int(self.vid_cap.get(cv2.CAP_PROP_FPS))
+            bar = init_progress_bar(frame_count, len(self.transforms) - 1, show_progress, 'Rendering')
+
+            # transforms[i] stabilizes frame i + 1; like stabilize, output starts at the third frame
+            grabbed_frame, frame = self._read_frame()
+            grabbed_frame = grabbed_frame and self.vid_cap.grab()
+            if not grabbed_frame:
+                return
+            if self._roi is not None:
+                w, h = self._roi_output_size(border_offset)
+            else:
+                h, w = _to_ndarray(frame).shape[:2]
+                w += 2 * border_offset
+                h += 2 * border_offset
+
+            scales = []
+            for rendition in renditions:
+                out_w, out_h = rendition.get('width'), rendition.get('height')
+                if out_w is None and out_h is None:
+                    out_w, out_h = w, h
+                elif out_w is None:
+                    out_w = int(round(w * out_h / float(h)))
+                elif out_h is None:
+                    out_h = int(round(h * out_w / float(w)))
+
+                scales.append(((out_w, out_h), np.array([[out_w / float(w)], [out_h / float(h)]])))
+                writers.append(cv2.VideoWriter(rendition['output_path'],
+                                               cv2.VideoWriter_fourcc(*rendition.get('output_fourcc', 'MJPG')),
+                                               fps, (out_w, out_h), True))
+
+            transform = np.zeros((2, 3))
+            for i in range(1, len(self.transforms)):
+                grabbed_frame, frame = self._read_frame()
+                if not grabbed_frame:
+                    break
+
+                transform_i = self.transforms[i]
+
+                if self._roi is not None:
+                    self._roi_warp_matrix(i, transform, (w, h))
+                else:
+                    # build transformation matrix with border offset folded in
+                    _fill_warp_matrix(transform, transform_i, border_size, neg_border_size)
+
+                for writer, (out_size, scale) in zip(writers, scales):
+                    if self._band_motion is not None:
+                        transformed = self._rolling_shutter_warp(frame, i, transform * scale, out_size, border_mode)
+                    else:
+                        transformed = cv2.warpAffine(frame, transform * scale, out_size, borderMode=border_mode)
+                    writer.write(_to_ndarray(transformed))
+                self.frames_written += 1
+
+                if bar is not None:
+                    bar.next()
+
+            if bar is not None:
+                bar.finish()
+        finally:
+            for writer in writers:
+                writer.release()
+            self.release()
 
     def _gen_transforms(self, smoothing_window):
-        self.trajectory = np.array(self._trajectory)
-        self.smoothed_trajectory = bfill_rolling_mean(self.trajectory, n=smoothing_window)
-        self.transforms = np.array(self._raw_transforms) + (self.smoothed_trajectory - self.trajectory)
+        n_rows = len(self._trajectory)
+        # rows before this were final on the last call; only the rest need to be (re)computed
+        first_row = self._n_smoothed_final
+
+        self._smoothed_trajectory.resize(n_rows)
+        self._transforms.resize(n_rows)
+
+        self.trajectory = self._trajectory.view()
+        self.smoothed_trajectory = self._smoothed_trajectory.view()
+        self.transforms = self._transforms.view()
+        self.metrics = self._raw_metrics.view()
+        self.roi_boxes = self._roi_boxes.view() if self._roi is not None else None
+
+        self.segments = list(zip(self._segment_starts, self._segment_starts[1:] + [n_rows]))
+        self._smooth_segments(self.trajectory, self.smoothed_trajectory, first_row, smoothing_window)
+
+        if self._band_motion is not None:
+            self._smoothed_band_trajectory.resize(n_rows)
+            self.band_motion = self._band_motion.view()
+            # smoothed as a flat (n_rows, 2 * n_bands) trajectory
+            self._smooth_segments(self._band_trajectory.view().reshape(n_rows, -1),
+                                  self._smoothed_band_trajectory.view().reshape(n_rows, -1),
+                                  first_row, smoothing_window)
+
+        self._update_transforms(first_row)
+
+        if n_rows - self._segment_starts[-1] >= smoothing_window:
+            self._n_smoothed_final = n_rows
+        else:
+            self._n_smoothed_final = self._segment_starts[-1]
+
+    def _update_transforms(self, first_row):
+        n_rows = len(self._trajectory)
+        np.subtract(self.smoothed_trajectory[first_row:], self.trajectory[first_row:],
+                    out=self.transforms[first_row:])
+        self.transforms[first_row:] += self._raw_transforms[first_row:]
+
+        # camera motion left in output after smoothing
+        jitter_start = max(first_row, 1)
+        smoothed_motion = (self.smoothed_trajectory[jitter_start:, :2] -
+                           self.smoothed_trajectory[jitter_start - 1:n_rows - 1, :2])
+        self.metrics['jitter'][jitter_start:] = np.sqrt(np.sum(smoothed_motion ** 2, axis=1))
+
+    def _adaptive_smoothing_windows(self, max_window):
+        """pick a smoothing window for each row from the jitter of the raw transforms around it"""
+        raw_motion = self._raw_transforms.view()[:, :2]
+        windows = np.empty(len(raw_motion))
+        for start, end in self.segments:
+            # jitter of each chunk of max_window rows: frame to frame motion that isn't a steady pan
+            chunk_starts = np.arange(start, end, max_window)
+            chunk_ends = np.minimum(chunk_starts + max_window, end)
+            chunk_windows = [np.sqrt(np.sum(raw_motion[chunk_start:chunk_end].std(axis=0) ** 2)) *
+                             ADAPTIVE_SMOOTHING_FRAMES_PER_PIXEL
+                             for chunk_start, chunk_end in zip(chunk_starts, chunk_ends)]
+
+            # interpolate between chunk centers so the window (and the smoothed path) changes gradually
+            chunk_centers = (chunk_starts + chunk_ends - 1) / 2.0
+            windows[start:end] = np.interp(np.arange(start, end), chunk_centers, chunk_windows)
+
+        return np.clip(np.round(windows), ADAPTIVE_SMOOTHING_MIN_WINDOW, max_window).astype(int)
+
+    def _gen_adaptive_transforms(self, max_window):
+        """re-smooth the full trajectory with a per segment window in one vectorized pass"""
+        self.smoothing_windows = self._adaptive_smoothing_windows(max_window)
+
+        self.smoothed_trajectory[:] = bfill_variable_rolling_mean(self.trajectory, self.smoothing_windows,
+                                                                  self.segments)
+        if self._band_motion is not None:
+            band_trajectory = self._band_trajectory.view().reshape(len(self.trajectory), -1)
+            self._smoothed_band_trajectory.view()[:] = bfill_variable_rolling_mean(
+                band_trajectory, self.smoothing_windows, self.segments).reshape(self._band_trajectory.view().shape)
+
+        self._update_transforms(0)
+
+    def _smooth_segments(self, trajectory, smoothed_trajectory, first_row, smoothing_window):
+        # smooth each segment between scene cuts independently
+        for start, end in self.segments:
+            if end <= first_row:
+                continue
+
+            window = min(smoothing_window, end - start)
+            if first_row < start + window - 1:
+                smoothed_trajectory[start:end] = bfill_rolling_mean(trajectory[start:end], n=window)
+            else:
+                # the rolling mean of a row only depends on the window of rows before it
+                calc_start = first_row - window + 1
+                smoothed = bfill_rolling_mean(trajectory[calc_start:end], n=window)
+                smoothed_trajectory[first_row:end] = smoothed[window - 1:]
+
+    def gen_transforms(self, input_path, smoothing_window=30, show_progress=True, scene_cut_threshold=None,
+                       checkpoint_path=None, checkpoint_interval=1000, roi=None, rolling_shutter_bands=None,
+                       adaptive_smoothing=False):
+        """Generate stabilizing transforms for a video without writing output
+
+        Results are stored in the ``trajectory``, ``smoothed_trajectory``, ``transforms`` & ``metrics``
+        attributes.  ``apply_transforms`` & ``apply_transforms_multi`` render these stored transforms
+        (including ones resumed from a checkpoint) without re-analysing the input.
 
-    def gen_transforms(self, input_path, smoothing_window=30, show_progress=True):
+        :param input_path: Path to input video to stabilize.
+                           Will be read with ``cv2.VideoCapture``; see opencv documentation for more info.
+        :param smoothing_window: window size to use when smoothing trajectory
+        :param show_progress: Should a progress bar be displayed to console?  If ``'json'``, progress is
+                              printed as JSON lines instead (see ``vidstab.utils.JsonProgressBar``).
+        :param scene_cut_threshold: Threshold for detecting hard cuts (see ``stabilize`` for more info)
+        :param checkpoint_path: If not ``None``, analysis state is saved to this file every
+                                ``checkpoint_interval`` frames.  If the file already exists (i.e. a previous
+                                run was interrupted), analysis resumes from the saved state by seeking the input
+                                with ``cv2.CAP_PROP_POS_FRAMES``.  The file is removed once analysis completes.
+                                Resuming requires a seekable input file (not a camera stream).  A ``ValueError``
+                                is raised if the checkpoint was saved for a different input (path, frame count
+                                or frame size) or with different analysis options.
+        :param checkpoint_interval: number of frames between checkpoint saves
+        :param roi: Subject box to lock stabilization on to (see ``stabilize`` for more info)
+        :param rolling_shutter_bands: Number of bands for rolling shutter correction (see ``stabilize`` for more info)
+        :param adaptive_smoothing: If ``True``, ``smoothing_window`` is only the largest window used.
+                                   Once all frames are analyzed, a window is picked for each stretch of
+                                   ``smoothing_window`` frames from the jitter of its raw transforms (calm footage
+                                   gets small windows, shaky footage up to ``smoothing_window``) and the
+                                   trajectory is re-smoothed with these windows in a single vectorized pass.
+                                   The windows used are stored in ``smoothing_windows``.
+        :return: Nothing is returned.
+
+        >>> from vidstab import VidStab
+        >>> stabilizer = VidStab()
+        >>> stabilizer.gen_transforms(input_path='long_input_video.mov', checkpoint_path='transforms.ckpt')
+        >>> stabilizer.apply_transforms_multi('long_input_video.mov', [{'output_path': 'stable_video.avi'}])
+        """
+        self.reset()
         self._smoothing_window = smoothing_window
+        self._scene_cut_threshold = scene_cut_threshold
+        self._checkpoint_path = checkpoint_path
+        self._checkpoint_interval = checkpoint_interval
+        self._set_roi(roi)
+        self._rolling_shutter_bands = rolling_shutter_bands
+        self._set_rolling_shutter(rolling_shutter_bands)
         self.vid_cap = cv2.VideoCapture(input_path)
-        self.frame_queue = deque(maxlen=smoothing_window)
-        self.frame_queue_inds = deque(maxlen=smoothing_window)
-        bar = self._init_trajectory(smoothing_window=smoothing_window,
-                                    max_frames=float('inf'),
-                                    gen_all=True,
-                                    show_progress=show_progress)
+        if checkpoint_path is not None:
+            self._checkpoint_run_info = self._run_info(input_path)
+        # analysis only looks at the latest frame; no frames are buffered for output
+        self._init_frame_queue(1)
+
+        try:
+            bar = self._init_trajectory(smoothing_window=smoothing_window,
+                                        max_frames=float('inf'),
+                                        gen_all=True,
+                                        show_progress=show_progress)
+        finally:
+            self.release()
+            self._checkpoint_path = None
+
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        if adaptive_smoothing:
+            self._gen_adaptive_transforms(smoothing_window)
 
         if bar:
             bar.finish()
 
     def stabilize(self, input_path, output_path, smoothing_window=30, max_frames=float('inf'),
                   border_type='black', border_size=0, layer_func=None, playback=False,
-                  use_stored_transforms=False, show_progress=True, output_fourcc='MJPG'):
+                  use_stored_transforms=False, show_progress=True, output_fourcc='MJPG', scene_cut_threshold=None,
+                  roi=None, rolling_shutter_bands=None, preview_address=None, preview_fps=15):
         """read video, perform stabilization, & write output to file
 
         :param input_path: Path to input video to stabilize.
@@ -354,8 +1166,33 @@ class VidStab:
         :param use_stored_transforms: should stored transforms from last stabilization be used instead of
                                       recalculating them?
         :param playback: Should the a comparison of input video/output video be played back during process?
-        :param show_progress: Should a progress bar be displayed to console?
+                         At most ``preview_fps`` frames per second are displayed (see
+                         ``vidstab.preview.Preview``); frames in between are skipped, so display barely slows
+                         down stabilization.  Press Q or ESC in the window to stop.
+        :param show_progress: Should a progress bar be displayed to console?  If ``'json'``, progress is
+                              printed as JSON lines instead (see ``vidstab.utils.JsonProgressBar``).
         :param output_fourcc: FourCC is a 4-byte code used to specify the video codec.
+        :param scene_cut_threshold: If not ``None``, hard cuts are detected when the mean absolute difference
+                                    (0-255 scale) between downsampled gray frames exceeds this value.
+                                    The trajectory on each side of a cut is smoothed independently.
+                                    A value around ``30`` works well for most edited footage.
+        :param roi: ``(x, y, w, h)`` bounding box of a subject in the first frame to lock stabilization on to.
+                    If given, motion is estimated only from keypoints inside the box (the box follows the subject
+                    using the optical flow of its keypoints) and output is cropped to a box of the same size
+                    that stays centered on the smoothed subject path.  The crop is applied as part of the
+                    stabilizing ``cv2.warpAffine``.  ``border_size`` is added around the output box.
+                    A ``ValueError`` is raised if the box doesn't overlap the first frame.  Frames where the
+                    box has no keypoints to track (e.g. a flat subject) get a zero transform
+                    (``metrics['fallback']``) and the box stays where it is.
+        :param rolling_shutter_bands: If given, each frame is split into this many horizontal bands and the motion
+                                      of each band left over after the global transform (rolling shutter
+                                      "jello") is tracked & smoothed like the trajectory.  Rows are shifted by
+                                      the interpolated correction of their band with ``cv2.remap`` before the
+                                      frame is warped.  Around ``8`` bands works well for 1080p footage.
+        :param preview_address: If not ``None``, low resolution JPEG previews of the latest stabilized frame
+                                are published to this local socket for headless monitoring: a UDP
+                                ``(host, port)`` address or a unix datagram socket path (one JPEG per datagram).
+        :param preview_fps: Maximum rate (frames per second) of ``playback`` & ``preview_address`` previews
         :return: Nothing is returned.  Output of stabilization is written to ``output_path``.
 
         >>> from vidstab.VidStab import VidStab
@@ -366,29 +1203,177 @@ class VidStab:
         >>> stabilizer.stabilize(input_path='input_video.mov', output_path='stable_video.avi')
 
         """
+        if not use_stored_transforms:
+            self.reset()
+        elif self.transforms is None:
+            raise AttributeError('No transforms to apply. '
+                                 'Use method gen_transforms to generate the transforms attribute')
+        else:
+            self.release()
+        self._smoothing_window = smoothing_window
+        self._scene_cut_threshold = scene_cut_threshold
+        self._set_roi(roi)
+        self._rolling_shutter_bands = rolling_shutter_bands
+        self._set_rolling_shutter(rolling_shutter_bands)
+
         self.vid_cap = cv2.VideoCapture(input_path)
-        frame_count = int(self.vid_cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
         # wait for camera to start up
         if isinstance(input_path, int):
             time.sleep(0.1)
 
-        self.frame_queue = deque(maxlen=smoothing_window)
-        self.frame_queue_inds = deque(maxlen=smoothing_window)
+        self._init_frame_queue(smoothing_window)
 
-        if not use_stored_transforms:
-            bar = self._init_trajectory(smoothing_window, max_frames, show_progress=show_progress)
-        else:
-            bar = init_progress_bar(frame_count, max_frames, show_progress)
+        try:
+            bar = self._init_trajectory(smoothing_window, max_frames, show_progress=show_progress,
+                                        use_stored_transforms=use_stored_transforms)
 
-        self._apply_transforms(output_path, max_frames, smoothing_window,
-                               border_type=border_type, border_size=border_size, layer_func=layer_func,
-                               playback=playback, output_fourcc=output_fourcc, progress_bar=bar)
-
-        cv2.destroyAllWindows()
+            self._apply_transforms(output_path, max_frames, smoothing_window,
+                                   border_type=border_type, border_size=border_size, layer_func=layer_func,
+                                   playback=playback, output_fourcc=output_fourcc, progress_bar=bar,
+                                   preview_address=preview_address, preview_fps=preview_fps,
+                                   use_stored_transforms=use_stored_transforms)
+        finally:
+            self.release()
 
         return
 
+    async def astabilize(self, input_path, smoothing_window=30, max_frames=float('inf'),
+                         border_type='black', border_size=0, layer_func=None,
+                         output_path=None, output_fourcc='MJPG', progress_callback=None, executor=None,
+                         scene_cut_threshold=None, roi=None, rolling_shutter_bands=None):
+        """asynchronously read video & yield stabilized frames
+
+        Asynchronous generator counterpart of ``stabilize`` for use inside an ``asyncio`` event loop.
+        The CPU bound work (reading, keypoint tracking, warping & writing) is run one frame at a time
+        in ``executor`` so the event loop is never blocked.  A frame is only processed when the consumer
+        asks for it, so a slow consumer applies backpressure to the stabilization process.
+        Cancelling the consuming task stops processing after the frame currently in progress.
+
+        ``vid_cap`` & ``writer`` are released when the generator finishes.  A consumer that ``break``s
+        out of the ``async for`` leaves them open until the generator is finalized (which is up to the
+        garbage collector), so close the generator explicitly: iterate inside
+        ``async with contextlib.aclosing(stabilizer.astabilize(...)) as frames:`` (python 3.10+) or
+        ``await frames.aclose()`` after breaking.
+
+        :param input_path: Path to input video to stabilize.
+                           Will be read with ``cv2.VideoCapture``; see opencv documentation for more info.
+        :param smoothing_window: window size to use when smoothing trajectory
+        :param max_frames: The maximum amount of frames to stabilize/process.
+        :param border_type: How to handle border when rotations are needed to stabilize.
+                            Options: ``['black', 'reflect', 'replicate']``
+        :param border_size: size of border in output
+        :param layer_func: Function to layer frames in output (see ``stabilize`` for more info)
+        :param output_path: Optional path to also save stabilized video to.
+                            Will be written with ``cv2.VideoWriter``; see opencv documentation for more info.
+        :param output_fourcc: FourCC is a 4-byte code used to specify the video codec.
+        :param progress_callback: Optional function called on the event loop after each frame as
+                                  ``progress_callback(frames_processed, frame_count)``.
+                                  ``frame_count`` is ``None`` if it can't be determined.
+        :param executor: ``concurrent.futures.Executor`` to run processing in.
+                         If ``None`` the event loop's default executor is used.
+        :param scene_cut_threshold: Threshold for detecting hard cuts (see ``stabilize`` for more info)
+        :param roi: Subject box to lock stabilization on to (see ``stabilize`` for more info)
+        :param rolling_shutter_bands: Number of bands for rolling shutter correction (see ``stabilize`` for more info)
+        :return: An asynchronous generator of stabilized frames (numpy arrays)
+
+        >>> import asyncio
+        >>> from vidstab import VidStab
+        >>> async def main():
+        ...     stabilizer = VidStab()
+        ...     async for frame in stabilizer.astabilize('input_video.mov', output_path='stable_video.avi'):
+        ...         pass  # do something with stabilized frame
+        >>> asyncio.run(main())
+
+        Stopping early:
+
+        >>> import contextlib
+        >>> async def first_frames(n=10):
+        ...     stabilizer = VidStab()
+        ...     async with contextlib.aclosing(stabilizer.astabilize('input_video.mov')) as frames:
+        ...         async for frame in frames:
+        ...             n -= 1
+        ...             if n == 0:
+        ...                 break  # vid_cap is released when the async with block exits
+        >>> asyncio.run(first_frames())
+        """
+        loop = asyncio.get_event_loop()
+
+        self.reset()
+        self._smoothing_window = smoothing_window
+        self._scene_cut_threshold = scene_cut_threshold
+        self._set_roi(roi)
+        self._rolling_shutter_bands = rolling_shutter_bands
+        self._set_rolling_shutter(rolling_shutter_bands)
+
+        def frames():
+            self.vid_cap = cv2.VideoCapture(input_path)
+            self._init_frame_queue(smoothing_window)
+            self._init_trajectory(smoothing_window, max_frames)
+
+            for _, transformed in self._stabilized_frames(max_frames, smoothing_window,
+                                                          border_type=border_type,
+                                                          border_size=border_size,
+                                                          layer_func=layer_func):
+                if output_path is not None:
+                    if self.writer is None:
+                        self._init_writer(output_path, transformed.shape[:2], output_fourcc,
+                                          fps=int(self.vid_cap.get(cv2.CAP_PROP_FPS)))
+                    self.writer.write(transformed)
+
+                yield transformed
+
+        frame_gen = frames()
+        frame_count = None
+        frames_processed = 0
+        pending = None
+        try:
+            while True:
+                # shielded so a cancelled consumer doesn't release resources from under a running frame
+                pending = loop.run_in_executor(executor, next, frame_gen, None)
+                transformed = await asyncio.shield(pending)
+                pending = None
+
+                if transformed is None:
+                    break
+
+                if progress_callback is not None:
+                    if frame_count is None:
+                        frame_count = int(self.vid_cap.get(cv2.CAP_PROP_FRAME_COUNT))
+                        frame_count = min(frame_count, max_frames) if frame_count > 0 else max_frames
+                        if frame_count == float('inf'):
+                            frame_count = None
+                    frames_processed += 1
+                    progress_callback(frames_processed, frame_count)
+
+                yield transformed
+        finally:
+            if pending is not None:
+                await asyncio.wait([pending])
+            frame_gen.close()
+            self.release()
+
+    def save_metrics(self, output_path):
+        """Save per frame quality metrics to a csv file
+
+        One row is written per transform with a header of the ``metrics`` field names.
+
+        :param output_path: path to save csv to
+        :return: Nothing is returned.
+
+        >>> from vidstab import VidStab
+        >>> stabilizer = VidStab()
+        >>> stabilizer.gen_transforms(input_path='input_video.mov')
+        >>> stabilizer.save_metrics('metrics.csv')
+        """
+        if self.metrics is None:
+            raise AttributeError('No metrics to save. '
+                                 'Use methods: gen_transforms or stabilize to generate the metrics attribute')
+
+        np.savetxt(output_path, self.metrics,
+                   fmt=['%d', '%.4f', '%.4f', '%d', '%.4f', '%d', '%d', '%d', '%.4f', '%.3f'],
+                   delimiter=',', header=','.join(self.metrics.dtype.names), comments='')
+
     def plot_trajectory(self):
         """Plot video trajectory
 
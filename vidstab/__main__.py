@@ -4,48 +4,288 @@ Arguments:
   -i --input
         Path to input video to stabilize.
   -o --output
-        Path to save stabilized video.
+        Path to save stabilized video.  If omitted, transforms are only generated
+        (e.g. to save quality metrics with --metricsOutput).
+  -p --playback
+        Should stabilization be played to screen?
   -k --keyPointMethod
         Name of keypoint detector to use.
+  --keyPointKwargs
+        JSON object of keyword arguments for the keypoint detector.
+  --targetKeypoints
+        Tune the keypoint detector's threshold frame by frame to find about this many keypoints
+        (at most this many are kept).
+  --frameBudgetMs
+        Lower the number of keypoints kept whenever analysing a frame takes longer than this.
+  -s --smoothingWindow
+        Number of frames to average the trajectory over.
+  --adaptiveSmoothing
+        Pick the smoothing window (up to --smoothingWindow) per stretch of video from its jitter
+        (transforms are generated in a separate pass).
+  -m --maxFrames
+        Maximum number of frames to stabilize.
+  --borderType
+        How to handle border when rotations are needed to stabilize (black, reflect, replicate).
+  -b --borderSize
+        Size of border in output (negative values crop into the frame).
+  --layerFunc
+        Layer each output frame on top of the previous output (none, overlay, blend).
+  -f --outputFourcc
+        FourCC code of the output video codec.
+  --sceneCutThreshold
+        Threshold for detecting hard cuts (segments between cuts are smoothed independently).
+  --roi
+        x,y,w,h box of a subject in the first frame to lock stabilization on to.
+  --rollingShutterBands
+        Number of horizontal bands for rolling shutter correction.
+  --checkpoint
+        File to save/resume analysis state from (transforms are generated in a separate pass).
+  --checkpointInterval
+        Number of frames between checkpoint saves.
+  -r --rendition
+        Extra output rendered from the same transforms as PATH or PATH:WIDTHxHEIGHT (repeatable).
+  --metricsOutput
+        Path to save per frame quality metrics csv.
+  --memmapDir
+        Directory to keep trajectory data in memory mapped files.
+  --useOpencl
+        Should frames be processed with cv2.UMat (OpenCL)?
+  --previewAddress
+        HOST:PORT (UDP) or unix socket path to publish low resolution JPEG previews to.
+  --previewFps
+        Maximum rate of playback/socket previews.
+  --progress
+        How to report progress (bar, json, none).  json prints one JSON object per line
+        followed by a final report with timing & throughput (frames written to --output, or frames
+        analysed if there's no output, plus analysis throughput as frames_analysed & analysis_fps).
 
 Usage:
     python -m vidstab -i input_video.mov -o stable_video.avi -k GFTT
+    python -m vidstab -i input_video.mov -o stable_video.avi -s 50 -b 20 --progress json
 """
+import argparse
+import json
+import re
+import time
+from .VidStab import VidStab
+from .layerutils import layer_blend, layer_overlay
 
-if __name__ == '__main__':
-    import argparse
-    from .VidStab import VidStab
-
-    def cvt_input_path(v):
-        try:
-            int_v = int(v)
-            return int_v
-        except ValueError:
-            return v
-
-    def str_2_bool(v):
-        if v.lower() in ('yes', 'true', 't', 'y', '1'):
-            return True
-        elif v.lower() in ('no', 'false', 'f', 'n', '0'):
-            return False
-        else:
-            raise argparse.ArgumentTypeError('Boolean value expected.')
-
-    # construct argument parser
-    ap = argparse.ArgumentParser()
+LAYER_FUNCS = {'none': None, 'overlay': layer_overlay, 'blend': layer_blend}
+
+
+def cvt_input_path(v):
+    try:
+        int_v = int(v)
+        return int_v
+    except ValueError:
+        return v
+
+
+def str_2_bool(v):
+    if v.lower() in ('yes', 'true', 't', 'y', '1'):
+        return True
+    elif v.lower() in ('no', 'false', 'f', 'n', '0'):
+        return False
+    else:
+        raise argparse.ArgumentTypeError('Boolean value expected.')
+
+
+def json_object(v):
+    try:
+        obj = json.loads(v)
+    except ValueError:
+        raise argparse.ArgumentTypeError('JSON object expected.')
+    if not isinstance(obj, dict):
+        raise argparse.ArgumentTypeError('JSON object expected.')
+    return obj
+
+
+def roi_box(v):
+    try:
+        box = tuple(int(x) for x in v.split(','))
+    except ValueError:
+        box = ()
+    if len(box) != 4:
+        raise argparse.ArgumentTypeError('ROI expected as x,y,w,h.')
+    return box
+
+
+def rendition(v):
+    """parse ``PATH`` or ``PATH:WIDTHxHEIGHT`` (either dimension may be left out to keep aspect ratio)"""
+    match = re.match(r'^(.+):(\d*)x(\d*)$', v)
+    if match is None:
+        return {'output_path': v}
+
+    spec = {'output_path': match.group(1)}
+    if match.group(2):
+        spec['width'] = int(match.group(2))
+    if match.group(3):
+        spec['height'] = int(match.group(3))
+    return spec
+
+
+def preview_address(v):
+    """parse ``HOST:PORT`` as a UDP address; anything else is used as a unix socket path"""
+    match = re.match(r'^(.*):(\d+)$', v)
+    if match is None:
+        return v
+    return match.group(1) or '127.0.0.1', int(match.group(2))
+
+
+def build_arg_parser():
+    ap = argparse.ArgumentParser(prog='python -m vidstab', description='Stabilize a video.')
     ap.add_argument('-i', '--input', type=cvt_input_path, required=True,
                     help='Path to input video to stabilize.')
-    ap.add_argument('-o', '--output', required=True,
-                    help='Path to save stabilized video.')
+    ap.add_argument('-o', '--output',
+                    help='Path to save stabilized video.  If omitted, transforms are only generated.')
     ap.add_argument('-p', '--playback', type=str_2_bool, default='false',
                     help='Should stabilization be played to screen?')
     ap.add_argument('-k', '--keyPointMethod', default='GFTT',
                     help='Name of keypoint detector to use.')
-    args = vars(ap.parse_args())
+    ap.add_argument('--keyPointKwargs', type=json_object, default={},
+                    help='JSON object of keyword arguments for the keypoint detector.')
+    ap.add_argument('--targetKeypoints', type=int, default=None,
+                    help="Tune the keypoint detector's threshold to find about this many keypoints per frame.")
+    ap.add_argument('--frameBudgetMs', type=float, default=None,
+                    help='Lower the number of keypoints kept whenever analysing a frame takes longer than this.')
+    ap.add_argument('-s', '--smoothingWindow', type=int, default=30,
+                    help='Number of frames to average the trajectory over.')
+    ap.add_argument('--adaptiveSmoothing', type=str_2_bool, default='false',
+                    help='Pick the smoothing window (up to --smoothingWindow) per stretch of video from its jitter.')
+    ap.add_argument('-m', '--maxFrames', type=float, default=float('inf'),
+                    help='Maximum number of frames to stabilize.')
+    ap.add_argument('--borderType', default='black', choices=['black', 'reflect', 'replicate'],
+                    help='How to handle border when rotations are needed to stabilize.')
+    ap.add_argument('-b', '--borderSize', type=int, default=0,
+                    help='Size of border in output (negative values crop into the frame).')
+    ap.add_argument('--layerFunc', default='none', choices=sorted(LAYER_FUNCS),
+                    help='Layer each output frame on top of the previous output.')
+    ap.add_argument('-f', '--outputFourcc', default='MJPG',
+                    help='FourCC code of the output video codec.')
+    ap.add_argument('--sceneCutThreshold', type=float, default=None,
+                    help='Threshold for detecting hard cuts (segments between cuts are smoothed independently).')
+    ap.add_argument('--roi', type=roi_box, default=None,
+                    help='x,y,w,h box of a subject in the first frame to lock stabilization on to.')
+    ap.add_argument('--rollingShutterBands', type=int, default=None,
+                    help='Number of horizontal bands for rolling shutter correction.')
+    ap.add_argument('--checkpoint', default=None,
+                    help='File to save/resume analysis state from (transforms are generated in a separate pass).')
+    ap.add_argument('--checkpointInterval', type=int, default=1000,
+                    help='Number of frames between checkpoint saves.')
+    ap.add_argument('-r', '--rendition', type=rendition, action='append', default=[],
+                    help='Extra output rendered from the same transforms as PATH or PATH:WIDTHxHEIGHT.')
+    ap.add_argument('--metricsOutput', default=None,
+                    help='Path to save per frame quality metrics csv.')
+    ap.add_argument('--memmapDir', default=None,
+                    help='Directory to keep trajectory data in memory mapped files.')
+    ap.add_argument('--useOpencl', type=str_2_bool, default='false',
+                    help='Should frames be processed with cv2.UMat (OpenCL)?')
+    ap.add_argument('--previewAddress', type=preview_address, default=None,
+                    help='HOST:PORT (UDP) or unix socket path to publish low resolution JPEG previews to.')
+    ap.add_argument('--previewFps', type=float, default=15,
+                    help='Maximum rate of playback/socket previews.')
+    ap.add_argument('--progress', default='bar', choices=['bar', 'json', 'none'],
+                    help='How to report progress.  json prints one JSON object per line.')
+    return ap
+
+
+def main(argv=None):
+    ap = build_arg_parser()
+    args = vars(ap.parse_args(argv))
+
+    # rendering stored transforms to several outputs is done in a separate pass from analysis
+    two_pass = args['checkpoint'] is not None or len(args['rendition']) > 0 or args['adaptiveSmoothing']
+    if two_pass and (args['playback'] or args['layerFunc'] != 'none' or args['maxFrames'] != float('inf') or
+                     args['previewAddress'] is not None):
+        ap.error('--playback, --previewAddress, --layerFunc & --maxFrames can not be used with '
+                 '--checkpoint, --rendition or --adaptiveSmoothing')
+    if args['rendition'] and args['output'] is None:
+        ap.error('--rendition requires --output')
+
+    show_progress = {'bar': True, 'json': 'json', 'none': False}[args['progress']]
 
     # init stabilizer with user specified keypoint detector
-    stabilizer = VidStab(kp_method=args['keyPointMethod'].upper())
-    # stabilize input video and write to specified output file
-    stabilizer.stabilize(input_path=args['input'],
-                         output_path=args['output'],
-                         playback=args['playback'])
+    stabilizer = VidStab(kp_method=args['keyPointMethod'].upper(),
+                         memmap_dir=args['memmapDir'],
+                         use_opencl=args['useOpencl'],
+                         target_kps=args['targetKeypoints'],
+                         frame_budget_ms=args['frameBudgetMs'],
+                         **args['keyPointKwargs'])
+
+    stage_seconds = {}
+    start = time.time()
+    if args['output'] is None or two_pass:
+        stabilizer.gen_transforms(input_path=args['input'],
+                                  smoothing_window=args['smoothingWindow'],
+                                  show_progress=show_progress,
+                                  scene_cut_threshold=args['sceneCutThreshold'],
+                                  checkpoint_path=args['checkpoint'],
+                                  checkpoint_interval=args['checkpointInterval'],
+                                  roi=args['roi'],
+                                  rolling_shutter_bands=args['rollingShutterBands'],
+                                  adaptive_smoothing=args['adaptiveSmoothing'])
+        stage_seconds['gen_transforms'] = time.time() - start
+
+        if args['output'] is not None:
+            renditions = [{'output_path': args['output'], 'output_fourcc': args['outputFourcc']}]
+            for spec in args['rendition']:
+                renditions.append(dict({'output_fourcc': args['outputFourcc']}, **spec))
+
+            render_start = time.time()
+            stabilizer.apply_transforms_multi(args['input'], renditions,
+                                              border_type=args['borderType'],
+                                              border_size=args['borderSize'],
+                                              show_progress=show_progress)
+            stage_seconds['apply_transforms'] = time.time() - render_start
+    else:
+        # stabilize input video and write to specified output file
+        stabilizer.stabilize(input_path=args['input'],
+                             output_path=args['output'],
+                             smoothing_window=args['smoothingWindow'],
+                             max_frames=args['maxFrames'],
+                             border_type=args['borderType'],
+                             border_size=args['borderSize'],
+                             layer_func=LAYER_FUNCS[args['layerFunc']],
+                             playback=args['playback'],
+                             show_progress=show_progress,
+                             output_fourcc=args['outputFourcc'],
+                             scene_cut_threshold=args['sceneCutThreshold'],
+                             roi=args['roi'],
+                             rolling_shutter_bands=args['rollingShutterBands'],
+                             preview_address=args['previewAddress'],
+                             preview_fps=args['previewFps'])
+        stage_seconds['stabilize'] = time.time() - start
+    elapsed = time.time() - start
+
+    if args['metricsOutput'] is not None:
+        stabilizer.save_metrics(args['metricsOutput'])
+
+    # every transform is the motion into one more frame of input; when stabilizing, analysis runs a
+    # smoothing window ahead of the frames written
+    n_analysed = len(stabilizer.transforms) + 1 if stabilizer.transforms is not None else 0
+    analysis_seconds = stage_seconds.get('gen_transforms', elapsed)
+    analysis_fps = n_analysed / analysis_seconds if analysis_seconds > 0 else None
+    n_frames = stabilizer.frames_written if args['output'] is not None else n_analysed
+    fps = n_frames / elapsed if elapsed > 0 else None
+    if args['progress'] == 'json':
+        report = {'event': 'report',
+                  'input': args['input'],
+                  'output': args['output'],
+                  'frames': n_frames,
+                  'elapsed': round(elapsed, 3),
+                  'fps': round(fps, 2) if fps is not None else None,
+                  'frames_analysed': n_analysed,
+                  'analysis_fps': round(analysis_fps, 2) if analysis_fps is not None else None,
+                  'stages': {k: round(v, 3) for k, v in stage_seconds.items()}}
+        if stabilizer.kp_autotuner is not None:
+            # final detector settings; per frame decisions are in --metricsOutput
+            threshold = stabilizer.kp_autotuner.threshold
+            report['autotune'] = {'kp_cap': stabilizer.kp_autotuner.cap,
+                                  'detector_threshold': None if threshold != threshold else threshold}
+        print(json.dumps(report), flush=True)
+    elif args['progress'] == 'bar':
+        print('\nProcessed {} frames in {:.1f}s ({:.1f} fps)'.format(n_frames, elapsed, fps or 0))
+
+
+if __name__ == '__main__':
+    main()
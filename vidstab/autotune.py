@@ -0,0 +1,159 @@
+import cv2
+import numpy as np
+
+# keep enough keypoints for a rigid transform to be estimated reliably
+MIN_KEYPOINT_CAP = 20
+
+
+def _threshold_knob(detector):
+    """``(getter, setter, bounds)`` of the detector setting that trades keypoint count for strength
+
+    Higher values always give fewer keypoints.  ``None`` if the detector has no such setting.
+    Integer settings have integer bounds.
+    """
+    if isinstance(detector, cv2.ORB):
+        return detector.getFastThreshold, detector.setFastThreshold, (1, 255)
+    if isinstance(detector, cv2.MSER):
+        return detector.getDelta, detector.setDelta, (1, 255)
+    if hasattr(detector, 'getThreshold') and hasattr(detector, 'setThreshold'):
+        # FAST, AGAST & BRISK
+        return detector.getThreshold, detector.setThreshold, (1, 255)
+
+    # imutils' python wrapped GFTT & HARRIS detectors
+    for attr in ('qualityLevel', 'T'):
+        if isinstance(getattr(detector, attr, None), float):
+            return (lambda: getattr(detector, attr),
+                    lambda value: setattr(detector, attr, value),
+                    (1e-4, 0.9))
+
+    return None
+
+
+def _cap_knob(detector):
+    """setter of the detector's own limit on the number of keypoints returned (``None`` if it has none)"""
+    if isinstance(detector, cv2.ORB):
+        return detector.setMaxFeatures
+    if hasattr(detector, 'maxCorners'):
+        return lambda value: setattr(detector, 'maxCorners', value)
+
+    return None
+
+
+class DetectorAutotuner:
+    """Adjust a keypoint detector frame by frame to keep its keypoint count & per frame cost stable
+
+    Two settings are controlled:
+
+    * the detector's threshold (e.g. FAST/BRISK/AGAST ``threshold``, ORB ``fastThreshold``, MSER ``delta``,
+      GFTT ``qualityLevel``), which is nudged after every detection towards ``target_kps`` keypoints
+    * a cap on the number of (strongest) keypoints kept, which starts at ``target_kps`` and is lowered
+      when a frame takes longer than ``frame_budget_ms`` (and raised back when there's time to spare)
+
+    The cap uses the detector's own limit when it has one (ORB ``maxFeatures``, GFTT ``maxCorners``),
+    otherwise the keypoints with the highest ``response`` are kept.
+
+    The detector is warm-started on the first frame of a video: detection is repeated (up to
+    ``warm_start_iters`` times) while the threshold is adjusted until the count is within ``tolerance``
+    of the target.  Tuned settings are kept between videos.
+
+    :param detector: keypoint detector with a ``detect(image)`` method
+    :param target_kps: number of keypoints to aim for on each frame
+    :param frame_budget_ms: per frame processing time to stay within (``None`` for no time budget)
+    :param tolerance: relative deviation from ``target_kps`` allowed before the threshold is changed
+    :param warm_start_iters: maximum number of detections on the first frame of a video
+
+    :ivar threshold: current threshold setting (``nan`` if the detector has no threshold setting)
+    :ivar cap: current maximum number of keypoints kept per frame
+    :ivar n_detected: number of keypoints detected on the last frame (before the cap is applied)
+
+    >>> import cv2
+    >>> tuner = DetectorAutotuner(cv2.FastFeatureDetector_create(), target_kps=300, frame_budget_ms=10)
+    >>> keypoints = tuner.detect(gray_frame, warm_start=True)
+    >>> tuner.record_frame_time(12.5)
+    """
+    def __init__(self, detector, target_kps=200, frame_budget_ms=None, tolerance=0.25, warm_start_iters=5):
+        self.detector = detector
+        self.target_kps = target_kps
+        self.frame_budget_ms = frame_budget_ms
+        self.tolerance = tolerance
+        self.warm_start_iters = warm_start_iters
+
+        self._threshold = _threshold_knob(detector)
+        self._set_cap = _cap_knob(detector)
+
+        self.cap = target_kps
+        self.n_detected = 0
+        if self._set_cap is not None:
+            self._set_cap(self.cap)
+
+    @property
+    def threshold(self):
+        return float(self._threshold[0]()) if self._threshold is not None else np.nan
+
+    def _adjust_threshold(self):
+        """nudge threshold towards the target count; returns ``False`` if count is within tolerance"""
+        if self._threshold is None:
+            return False
+
+        ratio = self.n_detected / float(self.target_kps)
+        if abs(ratio - 1) <= self.tolerance:
+            return False
+        # a detector that hit its own cap can't report how many keypoints it would have found
+        if self._set_cap is not None and self.n_detected >= self.cap:
+            return False
+
+        get_threshold, set_threshold, (low, high) = self._threshold
+        threshold = get_threshold()
+        new_threshold = threshold * np.clip(ratio, 0.5, 2.0) ** 0.5
+        if isinstance(low, int):
+            # integer thresholds move by at least one step in the right direction
+            step = int(round(new_threshold - threshold)) or (1 if ratio > 1 else -1)
+            new_threshold = threshold + step
+
+        new_threshold = type(low)(min(max(new_threshold, low), high))
+        if new_threshold == threshold:
+            return False
+
+        set_threshold(new_threshold)
+        return True
+
+    def detect(self, image, warm_start=False):
+        """Detect keypoints and adjust the detector for the next frame
+
+        :param image: image to detect keypoints in
+        :param warm_start: Should detection be repeated until the count is close to the target?
+        :return: list of (at most ``cap``) ``cv2.KeyPoint``
+        """
+        n_iters = self.warm_start_iters if warm_start else 1
+        for _ in range(n_iters):
+            kps = self.detector.detect(image)
+            self.n_detected = len(kps)
+            if not self._adjust_threshold():
+                break
+
+        if self._set_cap is None and len(kps) > self.cap:
+            kps = sorted(kps, key=lambda kp: kp.response, reverse=True)[:self.cap]
+
+        return kps
+
+    def record_frame_time(self, frame_ms):
+        """Adjust the keypoint cap from the time the last frame took to process
+
+        :param frame_ms: processing time of the last frame in milliseconds
+        :return: Nothing is returned.
+        """
+        if self.frame_budget_ms is None:
+            return
+
+        if frame_ms > self.frame_budget_ms:
+            cap = int(self.cap * 0.9 * self.frame_budget_ms / frame_ms)
+        elif frame_ms < 0.7 * self.frame_budget_ms:
+            cap = int(self.cap * 1.1) + 1
+        else:
+            return
+
+        cap = min(max(cap, MIN_KEYPOINT_CAP), self.target_kps)
+        if cap != self.cap:
+            self.cap = cap
+            if self._set_cap is not None:
+                self._set_cap(cap)
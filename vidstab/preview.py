@@ -0,0 +1,157 @@
+import socket
+import threading
+import time
+import cv2
+import imutils
+
+# keep encoded previews within a single UDP datagram
+MAX_DATAGRAM_SIZE = 65507
+
+
+class Preview:
+    """Show and/or publish stabilized frames at a capped rate
+
+    The processing loop hands over its latest frame with ``update``.  At most ``max_fps`` frames per second
+    are previewed; frames that arrive in between are dropped, and only previewed frames are resized.
+
+    Frames can be displayed in a ``cv2.imshow`` window and/or published as low resolution JPEGs to a local
+    socket for headless monitoring.  HighGUI isn't thread safe (and some backends, e.g. macOS, require the
+    main thread), so frames are displayed on the thread calling ``update``.  Encoding & sending JPEGs is done
+    from a background thread that samples the most recent frame, so publishing never blocks ``update``.
+    Each JPEG is sent as one datagram: to a UDP ``(host, port)`` address, or to a unix datagram socket if
+    ``address`` is a path.
+
+    :param display: Should frames be shown in a ``cv2.imshow`` window?
+    :param address: ``(host, port)`` or unix socket path to publish JPEG previews to (``None`` to not publish)
+    :param max_fps: Maximum number of frames to sample per second
+    :param window_name: Title of the display window
+    :param display_width: Maximum width of displayed frames
+    :param jpeg_width: Maximum width of published JPEG previews
+    :param jpeg_quality: Quality (0-100) of published JPEG previews
+
+    :ivar quit_requested: ``True`` once Q or ESC has been pressed in the display window
+    :ivar frames_received: number of frames passed to ``update``
+    :ivar frames_shown: number of frames displayed in the window
+    :ivar frames_published: number of frames sampled by the publishing thread
+
+    >>> import socket
+    >>> import numpy as np
+    >>> import cv2
+    >>> receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    >>> receiver.bind(('127.0.0.1', 5005))
+    >>> preview = Preview(address=('127.0.0.1', 5005))
+    >>> preview.start()
+    >>> preview.update(stabilized_frame)
+    >>> jpeg = cv2.imdecode(np.frombuffer(receiver.recv(65535), dtype='uint8'), cv2.IMREAD_COLOR)
+    >>> preview.stop()
+    """
+    def __init__(self, display=True, address=None, max_fps=15, window_name='VidStab Playback',
+                 display_width=1000, jpeg_width=320, jpeg_quality=70):
+        self.display = display
+        self.address = address
+        self.max_fps = max_fps
+        self.window_name = window_name
+        self.display_width = display_width
+        self.jpeg_width = jpeg_width
+        self.jpeg_quality = jpeg_quality
+
+        self.quit_requested = False
+        self.frames_received = 0
+        self.frames_shown = 0
+        self.frames_published = 0
+
+        self._last_shown = None
+        self._latest_frame = None
+        self._new_frame = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._socket = None
+
+    def start(self):
+        """Start the publishing thread (if publishing to an ``address``)
+
+        :return: Nothing is returned.
+        """
+        self._last_shown = None
+        if self.address is not None:
+            family = socket.AF_UNIX if isinstance(self.address, str) else socket.AF_INET
+            self._socket = socket.socket(family, socket.SOCK_DGRAM)
+            self._socket.setblocking(False)
+
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='VidStabPreview', daemon=True)
+            self._thread.start()
+
+    def update(self, frame):
+        """Offer the latest stabilized frame to the preview
+
+        Displays the frame (on the calling thread) if ``1 / max_fps`` seconds have passed since the last
+        displayed frame; publishing is handed off to the background thread and never blocks.
+
+        :param frame: stabilized frame; it's not copied so it shouldn't be modified afterwards
+        :return: Nothing is returned.
+        """
+        self.frames_received += 1
+
+        if self.display:
+            now = time.time()
+            if self._last_shown is None or now - self._last_shown >= 1.0 / self.max_fps:
+                self._last_shown = now
+                self.frames_shown += 1
+                self._show(frame)
+
+        if self._thread is not None:
+            self._latest_frame = frame
+            self._new_frame.set()
+
+    def stop(self):
+        """Stop the publishing thread and close the window/socket
+
+        :return: Nothing is returned.
+        """
+        self._stop.set()
+        self._new_frame.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+        if self.display and self.frames_shown:
+            cv2.destroyWindow(self.window_name)
+
+    def _run(self):
+        min_interval = 1.0 / self.max_fps
+        while not self._stop.is_set():
+            self._new_frame.wait()
+            self._new_frame.clear()
+            frame = self._latest_frame
+            if self._stop.is_set() or frame is None:
+                break
+
+            sampled_at = time.time()
+            self.frames_published += 1
+            self._publish(frame)
+
+            # frames offered while waiting are dropped; only the latest is kept
+            self._stop.wait(max(min_interval - (time.time() - sampled_at), 0))
+
+    def _show(self, frame):
+        cv2.imshow(self.window_name, imutils.resize(frame, width=min(frame.shape[1], self.display_width)))
+        key = cv2.waitKey(1)
+        if key == ord('q') or key == 27:
+            self.quit_requested = True
+
+    def _publish(self, frame):
+        small = imutils.resize(frame, width=min(frame.shape[1], self.jpeg_width))
+        encoded, jpeg = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not encoded or len(jpeg) > MAX_DATAGRAM_SIZE:
+            return
+
+        try:
+            self._socket.sendto(jpeg.tobytes(), self.address)
+        except OSError:
+            # nobody listening (or socket buffer full); monitoring is best effort
+            pass
@@ -1,7 +1,109 @@
+import json
+import sys
+import tempfile
+import time
 import numpy as np
 from progress.bar import IncrementalBar
 
 
+class GrowableArray:
+    """Append-only numpy array with amortized growth
+
+    Rows are stored in a preallocated numpy array whose capacity is doubled when full,
+    avoiding per-row python objects and full copies on every append.
+    Optionally, the data is backed by an (anonymous) memory mapped file for very long inputs.
+
+    :param row_shape: shape of each row (e.g. ``(3,)``; ``()`` for scalar or structured rows)
+    :param dtype: numpy dtype of stored data
+    :param capacity: number of rows to preallocate
+    :param memmap_dir: if not ``None``, the data is memory mapped to a temporary file in this directory
+
+    >>> arr = GrowableArray(row_shape=(3,))
+    >>> arr.append([1, 2, 3])
+    >>> arr.append(arr[-1] + [1, 2, 3])
+    >>> arr.view()
+    array([[1., 2., 3.],
+           [2., 4., 6.]])
+    """
+
+    def __init__(self, row_shape=(), dtype='float64', capacity=256, memmap_dir=None):
+        self.row_shape = tuple(row_shape)
+        self.dtype = np.dtype(dtype)
+        self._size = 0
+
+        if memmap_dir is not None:
+            self._file = tempfile.TemporaryFile(dir=memmap_dir)
+        else:
+            self._file = None
+
+        self._data = self._alloc(max(capacity, 1))
+
+    def _alloc(self, capacity):
+        shape = (capacity,) + self.row_shape
+        if self._file is None:
+            return np.empty(shape, dtype=self.dtype)
+
+        self._file.truncate(int(np.prod(shape)) * self.dtype.itemsize)
+        return np.memmap(self._file, dtype=self.dtype, mode='r+', shape=shape)
+
+    def _reserve(self, n_rows):
+        if n_rows <= self._data.shape[0]:
+            return
+
+        capacity = self._data.shape[0]
+        while capacity < n_rows:
+            capacity *= 2
+
+        if self._file is None:
+            data = self._alloc(capacity)
+            data[:self._size] = self._data[:self._size]
+        else:
+            # file is only ever grown, so the existing rows stay in place
+            self._data.flush()
+            data = self._alloc(capacity)
+
+        self._data = data
+
+    def append(self, row):
+        """Append a row, growing capacity if needed"""
+        self._reserve(self._size + 1)
+        self._data[self._size] = row
+        self._size += 1
+
+    def extend(self, rows):
+        """Append multiple rows, growing capacity if needed"""
+        rows = np.asarray(rows, dtype=self.dtype)
+        self._reserve(self._size + len(rows))
+        self._data[self._size:self._size + len(rows)] = rows
+        self._size += len(rows)
+
+    def resize(self, n_rows):
+        """Set number of rows; new rows are uninitialized"""
+        self._reserve(n_rows)
+        self._size = n_rows
+
+    def view(self):
+        """Zero-copy numpy view of the stored rows"""
+        return self._data[:self._size]
+
+    def close(self):
+        """Release backing memory (and temporary file if memory mapped)"""
+        self._data = self._data[:0]
+        self._size = 0
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self):
+        return self._size
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.view(), dtype=dtype)
+
+    def __getitem__(self, item):
+        return self.view()[item]
+
+
 def bfill_rolling_mean(arr, n=30):
     """Helper to perform trajectory smoothing
 
@@ -19,8 +121,8 @@ def bfill_rolling_mean(arr, n=30):
     if n == 1:
         return arr
 
-    pre_buffer = np.zeros(3).reshape(1, 3)
-    post_buffer = np.zeros(3 * n).reshape(n, 3)
+    pre_buffer = np.zeros((1, arr.shape[1]))
+    post_buffer = np.zeros((n, arr.shape[1]))
     arr_cumsum = np.cumsum(np.vstack((pre_buffer, arr, post_buffer)), axis=0)
     buffer_roll_mean = (arr_cumsum[n:, :] - arr_cumsum[:-n, :]) / float(n)
     trunc_roll_mean = buffer_roll_mean[:-n, ]
@@ -31,20 +133,132 @@ def bfill_rolling_mean(arr, n=30):
     return np.vstack((bfill, trunc_roll_mean))
 
 
+def bfill_variable_rolling_mean(arr, windows, segments=None):
+    """Helper to perform trajectory smoothing with a different window size for each row
+
+    Vectorized counterpart of ``bfill_rolling_mean``: each row is the mean of the ``windows[i]`` rows ending
+    at it, or of the first ``windows[i]`` rows of its segment if there aren't that many before it.
+    Rows are never averaged across segments.  A constant window gives the same result as ``bfill_rolling_mean``
+    applied to each segment.
+
+    :param arr: Numpy array of frame trajectory to be smoothed
+    :param windows: window size for each row of arr
+    :param segments: list of ``(start, end)`` row ranges smoothed independently (defaults to all rows)
+    :return: smoothed input arr
+
+    >>> arr = np.array([[1, 2, 3], [4, 5, 6], [7, 8, 9]])
+    >>> bfill_variable_rolling_mean(arr, [1, 1, 2])
+    array([[ 1. ,  2. ,  3. ],
+           [ 4. ,  5. ,  6. ],
+           [ 5.5,  6.5,  7.5]])
+    """
+    n_rows = arr.shape[0]
+    if segments is None:
+        segments = [(0, n_rows)]
+
+    lengths = [end - start for start, end in segments]
+    seg_starts = np.repeat([start for start, _ in segments], lengths)
+    seg_ends = np.repeat([end for _, end in segments], lengths)
+
+    windows = np.minimum(np.maximum(np.asarray(windows, dtype=int), 1), seg_ends - seg_starts)
+    window_ends = np.minimum(np.maximum(np.arange(n_rows) + 1, seg_starts + windows), seg_ends)
+
+    arr_cumsum = np.vstack((np.zeros((1, arr.shape[1])), np.cumsum(arr, axis=0)))
+    return (arr_cumsum[window_ends] - arr_cumsum[window_ends - windows]) / windows[:, None]
+
+
+def transform_inlier_ratio(transform, prev_pts, cur_pts, threshold=3.0):
+    """Share of matched keypoints that agree with an estimated transform
+
+    :param transform: 2x3 transformation matrix (or ``None`` if estimation failed)
+    :param prev_pts: numpy array of keypoint coordinates in previous frame (shape ``(n, 1, 2)``)
+    :param cur_pts: numpy array of matching keypoint coordinates in current frame (shape ``(n, 1, 2)``)
+    :param threshold: max distance in pixels between transformed & matched point to count as inlier
+    :return: inlier ratio between 0 and 1 (0 if transform is ``None`` or there are no points)
+
+    >>> transform = np.array([[1, 0, 1], [0, 1, 0]], dtype=float)
+    >>> prev_pts = np.array([[[0, 0]], [[5, 5]]], dtype='float32')
+    >>> cur_pts = np.array([[[1, 0]], [[20, 5]]], dtype='float32')
+    >>> transform_inlier_ratio(transform, prev_pts, cur_pts)
+    0.5
+    """
+    if transform is None or len(prev_pts) == 0:
+        return 0.0
+
+    prev_pts = prev_pts.reshape(-1, 2)
+    predicted = prev_pts.dot(transform[:, :2].T) + transform[:, 2]
+    residuals = np.sqrt(np.sum((predicted - cur_pts.reshape(-1, 2)) ** 2, axis=1))
+
+    return float(np.mean(residuals <= threshold))
+
+
+class JsonProgressBar:
+    """Progress reporter printing one JSON object per line for consumption by other programs
+
+    Has the ``next``/``finish`` interface of ``progress.bar.IncrementalBar`` so it can be used in its place.
+    Progress lines are written at most once every ``min_interval`` seconds (and when ``max`` is reached);
+    a ``finish`` line with the stage's throughput is always written.
+
+    :param message: name of the stage being reported on
+    :param max: expected number of frames (``None`` or ``inf`` if unknown)
+    :param min_interval: minimum number of seconds between progress lines
+    :param stream: file to write lines to (defaults to ``sys.stdout``)
+
+    >>> bar = JsonProgressBar('Stabilizing', max=30)
+    >>> bar.next()
+    {"event": "progress", "stage": "Stabilizing", "frames": 1, "total": 30, "percent": 3.3, "elapsed": 0.0, ...}
+    """
+    def __init__(self, message='Stabilizing', max=None, min_interval=1.0, stream=None):
+        self.message = message
+        self.max = None if max is None or max == float('inf') else int(max)
+        self.min_interval = min_interval
+        self.stream = stream
+        self.index = 0
+        self._start = time.time()
+        self._last_write = None
+
+    def _write(self, event):
+        elapsed = time.time() - self._start
+        line = {'event': event,
+                'stage': self.message,
+                'frames': self.index,
+                'total': self.max,
+                'percent': round(100.0 * self.index / self.max, 1) if self.max else None,
+                'elapsed': round(elapsed, 3),
+                'fps': round(self.index / elapsed, 2) if elapsed > 0 else None}
+
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write(json.dumps(line) + '\n')
+        stream.flush()
+        self._last_write = time.time()
+
+    def next(self, n=1):
+        self.index += n
+        if (self._last_write is None or self.index == self.max or
+                time.time() - self._last_write >= self.min_interval):
+            self._write('progress')
+
+    def finish(self):
+        self._write('finish')
+
+
 def init_progress_bar(frame_count, max_frames, show_progress=True, message='Stabilizing'):
     """Helper to create progress bar for stabilizing processes
 
     :param frame_count: input video's cv2.CAP_PROP_FRAME_COUNT
     :param max_frames: user provided max number of frames to process
-    :param show_progress: user input if bar should be created
+    :param show_progress: user input if bar should be created; ``'json'`` creates a ``JsonProgressBar``
     :param message: progress bar label
-    :return: a progress.bar.IncrementalBar
+    :return: a progress.bar.IncrementalBar (or JsonProgressBar)
 
     >>> init_progress_bar(30, float('inf'))
     >>> # use bar methods...
     Stabilizing |█████████████████████████▋      | 80%
     """
-    if show_progress:
+    if show_progress == 'json':
+        # reported even when the frame count is unknown
+        bar = JsonProgressBar(message, max=max_frames if frame_count <= 0 else min(frame_count, max_frames))
+    elif show_progress:
         # frame count is negative during some cv2.CAP_PROP_FRAME_COUNT failures
         if frame_count <= 0 and max_frames == float('inf'):
             bar = None